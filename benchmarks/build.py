@@ -0,0 +1,41 @@
+"""Tree build time as the schema grows, compared against the original
+depth-first builder.
+
+    python -m benchmarks.build
+"""
+from benchmarks.utils import make_schema, report, timed
+from modeltree.graph import graph
+from modeltree.tree import ModelTree
+from tests.cases.core.tests.test_build import LegacyModelTree, flatten
+
+SIZES = (25, 50, 100, 200, 400)
+
+
+def build(cls, root):
+    # Cached trees would otherwise be shared rather than built
+    graph.clear()
+    return cls(root)
+
+
+def main():
+    rows = []
+
+    for size in SIZES:
+        root = make_schema(size)[0]
+
+        tree = ModelTree(root)
+        legacy = LegacyModelTree(root)
+        assert flatten(tree.root_node) == flatten(legacy.root_node)
+
+        new = timed(lambda: build(ModelTree, root))
+        old = timed(lambda: build(LegacyModelTree, root))
+
+        rows.append((size, len(tree._nodes), '{0:.4f}'.format(old),
+                     '{0:.4f}'.format(new), '{0:.1f}x'.format(old / new)))
+
+    report(('models', 'nodes', 'depth-first (s)', 'breadth-first (s)',
+            'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Trees rooted at every model of a schema, comparing trees which traverse
+the relations with trees created again after they were evicted from a
+`LazyModelTrees` holding few trees, which take the plans cached by
+`modeltree.graph`.
+
+    python -m benchmarks.graph
+"""
+from benchmarks.utils import make_schema, report, timed
+from modeltree.graph import graph
+from modeltree.tree import LazyModelTrees
+from tests.cases.core.tests.test_build import flatten
+
+SIZES = (25, 50, 100, 200)
+
+# Trees kept by `LazyModelTrees`, far fewer than the roots
+MAX_TREES = 10
+
+
+def build_all(roots, cached):
+    if not cached:
+        graph.clear()
+
+    trees = LazyModelTrees({}, max_trees=MAX_TREES)
+
+    # Only the last trees are alive once done
+    return [trees.create(i, root).root_node for i, root in enumerate(roots)]
+
+
+def main():
+    rows = []
+
+    for size in SIZES:
+        roots = make_schema(size)
+
+        # As if MODELTREE_GRAPH_CACHE_SIZE were set to the number of roots
+        graph.plans.maxsize = size
+
+        old = timed(lambda: build_all(roots, False))
+
+        traversed = [flatten(node) for node in build_all(roots, False)]
+        new = timed(lambda: build_all(roots, True))
+
+        assert traversed == [flatten(node) for node in build_all(roots, True)]
+
+        rows.append((size, '{0:.4f}'.format(old), '{0:.4f}'.format(new),
+                     '{0:.1f}x'.format(old / new)))
+
+    report(('roots', 'traversed (s)', 'evicted (s)', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Memory used by the nodes of a tree and their index as the schema grows,
+compared against the representation before slotted nodes. The names of the
+nodes are copies, as they are when a tree is loaded from a snapshot.
+Requires Python 3.4+ for `tracemalloc`.
+
+    python -m benchmarks.memory
+"""
+import json
+import tracemalloc
+
+from benchmarks.utils import make_schema, report
+from modeltree.tree import ModelTree, ModelTreeNode
+
+SIZES = (25, 50, 100, 200, 400)
+
+
+class DictNode(object):
+    "The node with a `__dict__` and copies of the names of its model."
+    def __init__(self, model, parent=None, relation=None, reverse=None,
+                 related_name=None, accessor_name=None, nullable=False,
+                 depth=0):
+        self.model = model
+
+        self.app_name = model._meta.app_label
+        self.model_name = model._meta.object_name
+        self.db_table = model._meta.db_table
+        self.pk_column = model._meta.pk.column
+
+        self.parent = parent
+        self.parent_model = parent and parent.model or None
+
+        self.relation = relation
+        self.reverse = reverse
+
+        self.related_name = related_name
+        self.accessor_name = accessor_name
+        self.nullable = nullable
+        self.depth = depth
+
+        self.children = []
+        self._joins = None
+
+
+def copy_dict_nodes(tree, rows):
+    root = DictNode(tree.root_model)
+    nodes = {tree.root_model: {'parent': None, 'depth': 0, 'node': root}}
+
+    for model, parent, args in rows:
+        parent = nodes[parent]['node']
+        node = DictNode(model, parent, *args)
+        nodes[model] = {'parent': parent, 'depth': node.depth, 'node': node}
+        parent.children.append(node)
+
+    return nodes
+
+
+def copy_slotted_nodes(tree, rows):
+    root = ModelTreeNode(tree.root_model)
+    nodes = {tree.root_model: root}
+
+    for model, parent, args in rows:
+        parent = nodes[parent]
+        node = ModelTreeNode(model, parent, *args)
+        nodes[model] = node
+        parent.children.append(node)
+
+    return nodes
+
+
+def measure(func, *args):
+    "Returns the bytes allocated by `func` which are still in use."
+    tracemalloc.start()
+
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func(*args)  # noqa: F841
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    rows = []
+
+    for size in SIZES:
+        tree = ModelTree(make_schema(size)[0])
+        nodes = [n for n in tree._nodes.values() if n.parent]
+        nodes.sort(key=lambda n: n.depth)
+
+        # Copies of the names, like those read from a snapshot
+        names = json.loads(json.dumps([
+            [n.relation, n.related_name, n.accessor_name] for n in nodes]))
+
+        data = [(n.model, n.parent.model,
+                 (relation, n.reverse, related_name, accessor_name,
+                  n.nullable, n.depth))
+                for n, (relation, related_name, accessor_name)
+                in zip(nodes, names)]
+
+        count = len(data) + 1
+        old = measure(copy_dict_nodes, tree, data) / count
+        new = measure(copy_slotted_nodes, tree, data) / count
+
+        rows.append((size, count, '{0:.0f}'.format(old),
+                     '{0:.0f}'.format(new), '{0:.1f}x'.format(old / new)))
+
+    report(('models', 'nodes', 'dict (bytes/node)', 'slots (bytes/node)',
+            'ratio'), rows)
+
+
+if __name__ == '__main__':
+    main()
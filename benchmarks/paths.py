@@ -0,0 +1,45 @@
+"""Node path and query string lookups on deep trees, comparing the
+memoized tables with a search of the tree per lookup.
+
+    python -m benchmarks.paths
+"""
+from benchmarks.utils import make_schema, report, timed
+from modeltree.tree import ModelTree
+from tests.cases.core.tests.test_build import LegacyModelTree
+
+SIZES = (50, 100, 200, 400)
+
+
+def main():
+    rows = []
+
+    for size in SIZES:
+        schema = make_schema(size, links=1, window=2)
+        tree = ModelTree(schema[0])
+        legacy = LegacyModelTree(schema[0])
+        models = list(tree._nodes)
+        depth = max(len(tree._node_path(m)) for m in models)
+
+        def search():
+            for model in models:
+                path = legacy._node_path_to_model(model, legacy.root_node)
+                '__'.join(n.related_name for n in path or ())
+
+        def memoized():
+            for model in models:
+                tree._node_path(model)
+                tree.query_string(model)
+
+        old = timed(search, number=3) / len(models)
+        new = timed(memoized, number=3) / len(models)
+
+        rows.append((size, depth, '{0:.2f}'.format(old * 1e6),
+                     '{0:.2f}'.format(new * 1e6),
+                     '{0:.1f}x'.format(old / new)))
+
+    report(('models', 'max depth', 'search (us/lookup)',
+            'memoized (us/lookup)', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
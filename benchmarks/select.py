@@ -0,0 +1,58 @@
+"""Wide selects, comparing the join planner of `add_select` with joining
+each field's path on a new clone.
+
+    python -m benchmarks.select
+"""
+from itertools import cycle, islice
+
+from benchmarks.utils import report, timed
+from django.db.models.expressions import Col
+from modeltree.tree import ModelTree
+from tests import models
+
+WIDTHS = (5, 15, 30, 60)
+
+
+def legacy_select(tree, *fields):
+    "Joins per field as `add_select` did before the join planner."
+    queryset = tree.get_queryset()
+    queryset.query.default_cols = False
+    aliases = []
+
+    for field in [tree.root_model._meta.pk] + list(fields):
+        queryset, alias = tree.add_joins(field.model, queryset)
+        aliases.append(Col(alias, field, field))
+
+    queryset.query.select = aliases
+
+    return queryset
+
+
+def main():
+    tree = ModelTree(models.Employee)
+
+    available = [f for model in (models.Employee, models.Office,
+                                 models.Title, models.Project,
+                                 models.Meeting)
+                 for f in model._meta.concrete_fields]
+
+    rows = []
+
+    for width in WIDTHS:
+        fields = list(islice(cycle(available), width))
+
+        assert str(tree.add_select(*fields).query) == \
+            str(legacy_select(tree, *fields).query)
+
+        old = timed(lambda: legacy_select(tree, *fields), number=20)
+        new = timed(lambda: tree.add_select(*fields), number=20)
+
+        rows.append((width, '{0:.3f}'.format(old * 1e3),
+                     '{0:.3f}'.format(new * 1e3),
+                     '{0:.1f}x'.format(old / new)))
+
+    report(('columns', 'per field (ms)', 'planned (ms)', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
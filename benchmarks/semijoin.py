@@ -0,0 +1,85 @@
+"""Filters through a many-to-many node, comparing `EXISTS` subqueries with
+the join form, which needs `DISTINCT` to not duplicate root rows. Runs on
+an in-memory SQLite database.
+
+    python -m benchmarks.semijoin
+"""
+import random
+
+from benchmarks.utils import report, timed
+from django.core.management import call_command
+from django.db import connection
+from tests import models
+
+SIZES = (1000, 5000, 20000)
+
+PROJECTS_PER_EMPLOYEE = 10
+
+
+def populate(size, seed=0):
+    rng = random.Random(seed)
+
+    models.Project.employees.through.objects.all().delete()
+    models.Project.objects.all().delete()
+    models.Employee.objects.all().delete()
+
+    title = models.Title.objects.create(name='Engineer', salary=10)
+    office = models.Office.objects.create(location='Outer Space')
+
+    models.Employee.objects.bulk_create([
+        models.Employee(first_name=str(i), last_name='Last', title=title,
+                        office=office)
+        for i in range(size)
+    ])
+
+    manager = models.Employee.objects.all()[0]
+    models.Project.objects.bulk_create([
+        models.Project(name='P{0}'.format(i % 20), manager=manager,
+                       due_date='2020-01-01')
+        for i in range(size // 10)
+    ])
+
+    employees = list(models.Employee.objects.values_list('pk', flat=True))
+    projects = list(models.Project.objects.values_list('pk', flat=True))
+    through = models.Project.employees.through
+
+    through.objects.bulk_create([
+        through(employee_id=employee, project_id=project)
+        for employee in employees
+        for project in rng.sample(projects, PROJECTS_PER_EMPLOYEE)
+    ], batch_size=500)
+
+
+def main():
+    connection.settings_dict['NAME'] = ':memory:'
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+    names = ['P{0}'.format(i) for i in range(5)]
+    rows = []
+
+    for size in SIZES:
+        populate(size)
+
+        joined = models.Employee.branches\
+            .filter(project__name__in=names).distinct()
+        exists = models.Employee.branches.semijoin()\
+            .filter(project__name__in=names)
+
+        assert sorted(joined.values_list('pk', flat=True)) == \
+            sorted(exists.values_list('pk', flat=True))
+
+        old = timed(lambda: list(joined.values_list('pk', flat=True)),
+                    number=5)
+        new = timed(lambda: list(exists.values_list('pk', flat=True)),
+                    number=5)
+
+        rows.append((size, '{0:.1f}'.format(old * 1e3),
+                     '{0:.1f}'.format(new * 1e3),
+                     '{0:.1f}x'.format(old / new)))
+
+    report(('employees', 'join + distinct (ms)', 'exists (ms)', 'speedup'),
+           rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Repeated point queries of the same shape, comparing a query built and
+compiled on each call with a compiled template. Runs on an in-memory SQLite
+database with few rows, so the time is mostly spent in Python.
+
+    python -m benchmarks.template
+"""
+from benchmarks.utils import report, timed
+from django.core.management import call_command
+from django.db import connection
+from tests import models
+
+WIDTHS = (1, 5, 10)
+
+CALLS = 200
+
+
+def main():
+    connection.settings_dict['NAME'] = ':memory:'
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+    title = models.Title.objects.create(name='Engineer', salary=10)
+    office = models.Office.objects.create(location='Outer Space')
+    models.Employee.objects.create(first_name='First', last_name='Last',
+                                   title=title, office=office)
+
+    available = [models.Title._meta.get_field('salary'),
+                 models.Title._meta.get_field('name'),
+                 models.Office._meta.get_field('location'),
+                 models.Project._meta.get_field('name'),
+                 models.Project._meta.get_field('due_date'),
+                 models.Meeting._meta.get_field('start_time'),
+                 models.Meeting._meta.get_field('end_time'),
+                 models.Employee._meta.get_field('first_name'),
+                 models.Employee._meta.get_field('last_name'),
+                 models.Office._meta.get_field('id')]
+
+    lookups = ('title__salary__gt', 'office__location', 'first_name')
+    rows = []
+
+    for width in WIDTHS:
+        fields = available[:width]
+
+        def built(i):
+            return list(models.Employee.branches.select(*fields).filter(
+                title__salary__gt=i, office__location='Outer Space',
+                first_name='First').raw())
+
+        def templated(i):
+            template = models.Employee.branches.template(
+                *lookups, fields=fields)
+
+            return list(template.raw(
+                title__salary__gt=i, office__location='Outer Space',
+                first_name='First'))
+
+        assert built(0) == templated(0)
+
+        old = timed(lambda: [built(i) for i in range(CALLS)])
+        new = timed(lambda: [templated(i) for i in range(CALLS)])
+
+        rows.append((width, '{0:.3f}'.format(old * 1e3 / CALLS),
+                     '{0:.3f}'.format(new * 1e3 / CALLS),
+                     '{0:.1f}x'.format(old / new)))
+
+    report(('columns', 'built (ms)', 'template (ms)', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Shared setup for the benchmark scripts. Each script is run as a module
+from the repository root, e.g. `python -m benchmarks.build`.
+"""
+import os
+import random
+import sys
+import timeit
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import models  # noqa: E402
+
+
+def make_schema(size, seed=0, links=2, m2m_ratio=0.1, window=None):
+    """Registers `size` throwaway models in the tests app which are related
+    randomly to the models created before them. Returns the list of models,
+    the first of which is a good root for a tree.
+
+    If `window` is set, models are only related to the `window` models
+    created just before them which produces deep trees.
+    """
+    rand = random.Random(seed)
+    prefix = 'Schema{0}x{1}x{2}x'.format(size, links, window or 0)
+    created = []
+
+    for i in range(size):
+        attrs = {
+            '__module__': 'tests.models',
+            'Meta': type('Meta', (object,), {'app_label': 'tests'}),
+        }
+
+        if created:
+            candidates = created[-window:] if window else created
+            targets = rand.sample(candidates, min(len(candidates), links))
+
+            for j, target in enumerate(targets):
+                name = 'link{0}'.format(j)
+
+                if rand.random() < m2m_ratio:
+                    attrs[name] = models.ManyToManyField(
+                        target, related_name='{0}{1}_{2}'.format(
+                            prefix, i, name))
+                else:
+                    attrs[name] = models.ForeignKey(
+                        target, null=rand.random() < 0.5,
+                        related_name='{0}{1}_{2}'.format(prefix, i, name))
+
+        name = '{0}{1}'.format(prefix, i)
+        created.append(type(str(name), (models.Model,), attrs))
+
+    return created
+
+
+def timed(func, number=1, repeat=3):
+    "Returns the best time in seconds of `number` calls to `func`."
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(header, rows):
+    "Writes a simple aligned table to stdout."
+    widths = [max(len(str(r[i])) for r in [header] + rows)
+              for i in range(len(header))]
+
+    for row in [header] + rows:
+        sys.stdout.write('  '.join(str(c).rjust(w)
+                                   for c, w in zip(row, widths)))
+        sys.stdout.write('\n')
@@ -19,3 +19,5 @@ def get_version(short=False):
 
 
 __version__ = get_version()
+
+default_app_config = 'modeltree.apps.ModelTreeConfig'
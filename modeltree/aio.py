@@ -0,0 +1,172 @@
+"""Awaitable counterparts of the blocking query methods for use with
+asyncio. The queries run in the thread pool of `modeltree.executor`, so
+the event loop is not blocked while they execute. The rows of asynchronous
+iterators are fetched by a thread of each iterator, so open iterators do
+not hold the workers of the pool.
+
+The awaitables are asyncio futures rather than coroutines, so this module
+does not require the async syntax of Python 3.5+ to be importable.
+"""
+import collections
+import itertools
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from modeltree import executor
+from six.moves import queue
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+
+__all__ = ('run', 'AsyncRows')
+
+
+def _require_asyncio():
+    if asyncio is None:
+        raise ImproperlyConfigured('asyncio is required for async queries')
+
+
+def run(using, func, *args, **kwargs):
+    """Calls `func` in the thread pool with a connection to the database
+    `using` and returns an asyncio future of its result.
+    """
+    _require_asyncio()
+    return asyncio.wrap_future(executor.submit(using, func, *args, **kwargs))
+
+
+def _fetch(requests, queryset, chunk_size):
+    """Fetches a chunk of rows for each future put on the `requests` queue
+    until the rows are exhausted or None is put on the queue.
+    """
+    rows = queryset.raw(chunk_size=chunk_size)
+
+    try:
+        while True:
+            request = requests.get()
+
+            if request is None or \
+                    not request.set_running_or_notify_cancel():
+                break
+
+            try:
+                chunk = list(itertools.islice(rows, chunk_size))
+            except Exception as e:
+                request.set_exception(e)
+                break
+
+            request.set_result(chunk)
+
+            if not chunk:
+                break
+    finally:
+        # Closes the cursor in the thread that opened it
+        if hasattr(rows, 'close'):
+            rows.close()
+
+
+def _stream(job, requests, queryset, chunk_size):
+    "Fetches the rows of `queryset` and sets the result of `job` when done."
+    try:
+        _fetch(requests, queryset, chunk_size)
+    except Exception as e:
+        job.set_exception(e)
+    else:
+        job.set_result(None)
+    finally:
+        # The connection belongs to this thread, which ends here
+        connections[queryset.db].close()
+
+
+class AsyncRows(object):
+    """Asynchronous iterator over the rows of a queryset.
+
+    The rows are fetched `chunk_size` at a time by a thread of the
+    iterator, which holds its own connection and the cursor until the rows
+    are exhausted or the iterator is closed. The thread is not a worker of
+    the pool, so other queries can be awaited while iterating. A chunk is
+    only fetched once the rows of the previous one have been consumed.
+    """
+    def __init__(self, queryset, chunk_size):
+        _require_asyncio()
+
+        self._rows = collections.deque()
+        self._requests = queue.Queue()
+        self._done = False
+        self._job = Future()
+
+        # The thread must not reference the iterator so an abandoned
+        # iterator can be collected and stop the thread.
+        thread = threading.Thread(target=_stream, args=(
+            self._job, self._requests, queryset, chunk_size))
+        thread.daemon = True
+        thread.start()
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        loop = asyncio.get_event_loop()
+        result = asyncio.Future(loop=loop)
+
+        if self._rows:
+            result.set_result(self._rows.popleft())
+        elif self._done:
+            result.set_exception(StopAsyncIteration())
+        else:
+            request = Future()
+            self._requests.put(request)
+
+            asyncio.wrap_future(request, loop=loop)\
+                .add_done_callback(lambda f: self._fill(f, result))
+
+        return result
+
+    def _fill(self, request, result):
+        error = None
+
+        if request.cancelled():
+            error = StopAsyncIteration()
+        elif request.exception() is not None:
+            error = request.exception()
+        elif not request.result():
+            error = StopAsyncIteration()
+
+        if error is not None:
+            self._done = True
+        else:
+            self._rows.extend(request.result())
+
+        if result.cancelled():
+            return
+
+        if error is not None:
+            result.set_exception(error)
+        else:
+            result.set_result(self._rows.popleft())
+
+    def aclose(self):
+        """Stops fetching rows and returns a future which is done once the
+        cursor is closed.
+        """
+        self.close()
+        return asyncio.wrap_future(self._job)
+
+    def close(self):
+        self._rows.clear()
+
+        if not self._done:
+            self._done = True
+            self._requests.put(None)
+
+    def __del__(self):
+        # Stops the thread if the iterator is abandoned
+        if hasattr(self, '_requests'):
+            self.close()
@@ -0,0 +1,22 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class ModelTreeConfig(AppConfig):
+    name = 'modeltree'
+
+    def ready(self):
+        from modeltree import results
+
+        # Processes which change data but never read cached results must
+        # still start new generations of the tables in a shared cache
+        results.connect()
+
+        # Builds the trees defined in settings on startup rather than on
+        # first use. When this runs before a pre-forking server forks, the
+        # workers share the built trees.
+        if getattr(settings, 'MODELTREE_WARM', False):
+            from modeltree.tree import trees
+
+            trees.warm(workers=getattr(settings, 'MODELTREE_WARM_WORKERS',
+                                       None))
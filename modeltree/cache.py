@@ -0,0 +1,80 @@
+import threading
+from collections import OrderedDict
+
+__all__ = ('LRUCache',)
+
+
+class LRUCache(object):
+    """A thread-safe mapping bounded to `maxsize` entries which evicts the
+    least recently used entry when full. A `maxsize` of zero disables the
+    cache. Hits, misses and evictions are counted.
+    """
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The entries are not pickled, a cache is only filled in the
+        # process using it
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_data'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            # Reinsert as the most recently used
+            self._data[key] = value
+            self.hits += 1
+
+            return value
+
+    def set(self, key, value):
+        if not self.maxsize:
+            return
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        "Returns a dict of the cache counters."
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
@@ -0,0 +1,213 @@
+"""Join costs derived from table statistics.
+
+A `CostModel` estimates the cost of joining a relation from the number of
+rows of the joined tables, whether the joined columns are indexed and
+whether the join is an outer join. `ModelTree` uses it to choose the
+cheapest path among paths of equal length.
+
+Row counts are bucketed by their order of magnitude (base 2), so small
+changes in the data do not change the chosen paths.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+
+from django.db import DatabaseError, connections
+
+__all__ = ('CostModel', 'DatabaseStatistics', 'StaticStatistics',
+           'database_statistics')
+
+# Factor applied to the cost of outer joins
+OUTER_JOIN_FACTOR = 1.5
+
+
+def magnitude(rows):
+    "Returns the order of magnitude (base 2) of a number of rows."
+    return int(math.log(max(rows, 0) + 1, 2))
+
+
+class StaticStatistics(object):
+    """Statistics from fixed values, e.g. for tests.
+
+        `rows` - a dict of the number of rows by table name. Tables which
+        are not listed are empty.
+
+        `indexes` - a dict of the indexed columns by table name. If not set,
+        all columns are considered indexed.
+    """
+    def __init__(self, rows=None, indexes=None):
+        self.rows = rows or {}
+        self.indexes = indexes
+
+    def row_count(self, table):
+        return self.rows.get(table, 0)
+
+    def is_indexed(self, table, column):
+        if self.indexes is None:
+            return True
+
+        return column in self.indexes.get(table, ())
+
+
+class DatabaseStatistics(object):
+    """Statistics gathered from the database `using`. The planner's row
+    estimates are used on PostgreSQL and MySQL, and the rows are counted on
+    other backends. Results are cached for `max_age` seconds.
+    """
+    def __init__(self, using='default', max_age=3600):
+        self.using = using
+        self.max_age = max_age
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The statistics are gathered again by the process using them
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_cache'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get(self, key, func):
+        with self._lock:
+            entry = self._cache.get(key)
+
+        if entry is None or time.time() - entry[0] > self.max_age:
+            # Tables may not exist yet, e.g. before migrations are run.
+            # SQLite's introspection raises ValueError for these.
+            try:
+                value = func()
+            except (DatabaseError, ValueError):
+                value = None
+
+            entry = (time.time(), value)
+
+            with self._lock:
+                self._cache[key] = entry
+
+        return entry[1]
+
+    def _count(self, table):
+        connection = connections[self.using]
+
+        if connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+            params = [table]
+        elif connection.vendor == 'mysql':
+            sql = ('SELECT table_rows FROM information_schema.tables '
+                   'WHERE table_schema = DATABASE() AND table_name = %s')
+            params = [table]
+        else:
+            sql = 'SELECT COUNT(*) FROM {0}'.format(
+                connection.ops.quote_name(table))
+            params = []
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+
+        return int(row[0] or 0) if row else 0
+
+    def _indexes(self, table):
+        "Returns the leading columns of the indexes of the table."
+        connection = connections[self.using]
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection\
+                .get_constraints(cursor, table)
+
+        return frozenset(
+            c['columns'][0] for c in constraints.values()
+            if c['columns'] and
+            (c['index'] or c['primary_key'] or c['unique']))
+
+    def row_count(self, table):
+        return self._get(('rows', table), lambda: self._count(table)) or 0
+
+    def is_indexed(self, table, column):
+        indexes = self._get(('indexes', table), lambda: self._indexes(table))
+        return column in (indexes or ())
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_statistics = {}
+_statistics_lock = threading.Lock()
+
+
+def database_statistics(using='default'):
+    """Returns the statistics of the database `using`, which are shared by
+    all trees so each table is only looked up once.
+    """
+    with _statistics_lock:
+        if using not in _statistics:
+            _statistics[using] = DatabaseStatistics(using=using)
+
+        return _statistics[using]
+
+
+class CostModel(object):
+    "Estimates the cost of the joins of a relation from `statistics`."
+    def __init__(self, statistics):
+        self.statistics = statistics
+
+    def lookup_cost(self, table, column):
+        """Returns the cost of looking up rows of `table` by `column`. A
+        lookup on an indexed column grows with the logarithm of the number
+        of rows, otherwise the table is scanned.
+        """
+        rows = magnitude(self.statistics.row_count(table))
+
+        if self.statistics.is_indexed(table, column):
+            return rows + 1
+
+        return 2 ** rows
+
+    def join_steps(self, relation):
+        """Returns the (table, column) pairs of the tables joined for a
+        relation and the column each is joined on.
+        """
+        field = relation.field
+        target = relation.target._meta
+
+        if relation.relation == 'manytomany':
+            if relation.reverse:
+                column = field.m2m_reverse_name()
+            else:
+                column = field.m2m_column_name()
+
+            return [(field.m2m_db_table(), column),
+                    (target.db_table, target.pk.column)]
+
+        if relation.reverse:
+            return [(target.db_table, field.column)]
+
+        return [(target.db_table, field.rel.get_related_field().column)]
+
+    def join_cost(self, relation):
+        cost = sum(self.lookup_cost(table, column)
+                   for table, column in self.join_steps(relation))
+
+        if relation.nullable:
+            cost *= OUTER_JOIN_FACTOR
+
+        return cost
+
+    def digest(self, relations):
+        """Returns a digest of the statistics the costs of `relations` are
+        derived from.
+        """
+        data = sorted(
+            [table, column, magnitude(self.statistics.row_count(table)),
+             self.statistics.is_indexed(table, column)]
+            for relation in relations
+            for table, column in self.join_steps(relation))
+
+        return hashlib.sha1(json.dumps(data).encode('utf-8')).hexdigest()
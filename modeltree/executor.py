@@ -0,0 +1,78 @@
+"""A bounded thread pool for running tree queries off the calling thread.
+
+The number of workers is set by the `MODELTREE_WORKERS` setting. Each
+worker uses its own connection to each database, so at most that many
+connections per database are opened by the pool. Connections are handled
+as they are at the end of a request: they are closed after a job unless
+they are persistent (`CONN_MAX_AGE`) and still usable.
+
+On Python 2 the `futures` package must be installed.
+"""
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+__all__ = ('get_executor', 'submit', 'shutdown')
+
+DEFAULT_WORKERS = 4
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    "Returns the shared thread pool, creating it on first use."
+    global _executor
+
+    if _executor is None:
+        if ThreadPoolExecutor is None:
+            raise ImproperlyConfigured('The futures package must be '
+                                       'installed to run queries in a '
+                                       'thread pool')
+
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=getattr(
+                    settings, 'MODELTREE_WORKERS', DEFAULT_WORKERS))
+
+    return _executor
+
+
+def call(using, func, *args, **kwargs):
+    """Calls `func` with a usable connection to the database `using` and
+    releases the connection afterwards.
+    """
+    connection = connections[using]
+    connection.close_if_unusable_or_obsolete()
+
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connection.close_if_unusable_or_obsolete()
+
+
+def submit(using, func, *args, **kwargs):
+    """Schedules `func` to be called in the thread pool with a connection
+    to the database `using` and returns a `concurrent.futures.Future`.
+    """
+    return get_executor().submit(call, using, func, *args, **kwargs)
+
+
+def shutdown(wait=True):
+    """Shuts down the thread pool. A new pool is created the next time a
+    job is submitted, e.g. after the `MODELTREE_WORKERS` setting changed.
+    """
+    global _executor
+
+    with _lock:
+        executor, _executor = _executor, None
+
+    if executor is not None:
+        executor.shutdown(wait=wait)
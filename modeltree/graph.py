@@ -0,0 +1,100 @@
+"""Shortest-path trees of the model relation graph, shared by the trees
+with the same root model and route policy.
+
+The nodes of a tree only depend on its root model and on the options which
+restrict or weigh its joins, i.e. the excluded models, the required and
+excluded routes and the route costs. The relations are traversed once per
+root model and policy, and the nodes and indexes of the tree are shared by
+every tree with the same key, e.g. trees of several aliases with the same
+configuration or trees which are created again after they were evicted from
+`modeltree.tree.trees`. Such trees are views of the shared state, which is
+not modified once built.
+
+The graph keeps the `MODELTREE_GRAPH_CACHE_SIZE` most recently used plans
+(100 by default), independently of `MODELTREE_MAX_TREES`. Plans dropped from
+the cache are still shared while trees use them and are freed with the last
+of them.
+
+Trees with statistics are not shared since their paths depend on the data.
+The shared trees are cleared when a model is registered.
+"""
+import threading
+import weakref
+
+from django.conf import settings
+from django.db.models.signals import class_prepared
+from modeltree.cache import LRUCache
+
+__all__ = ('ModelGraph', 'Plan', 'graph')
+
+
+class Plan(object):
+    "The built state of a tree, kept alive by the graph and by its trees."
+    def __init__(self, state):
+        self.state = state
+
+
+class ModelGraph(object):
+    """The plans of trees keyed by root model and route policy, see
+    `ModelTree.policy_key`. At most `maxsize` recently used plans are kept
+    when no tree uses them.
+    """
+    def __init__(self, maxsize=100):
+        self.plans = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._used = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def plan(self, key, build):
+        """Returns the plan of the tree of `key`, i.e. its nodes and
+        indexes. `build` is called to build its state if it is neither
+        cached nor in use.
+        """
+        plan = self.plans.get(key)
+
+        if plan is None:
+            with self._lock:
+                plan = self._used.get(key)
+
+        if plan is None:
+            self.misses += 1
+            plan = Plan(build())
+
+            with self._lock:
+                # Another thread may have built the same tree meanwhile
+                plan = self._used.setdefault(key, plan)
+        else:
+            self.hits += 1
+
+        self.plans.set(key, plan)
+
+        return plan
+
+    def clear(self):
+        self.plans.clear()
+
+        with self._lock:
+            self._used.clear()
+
+    def stats(self):
+        "Returns a dict of the counters of the plans."
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.plans.evictions,
+            'size': len(self.plans),
+            'maxsize': self.plans.maxsize,
+            'used': len(self._used),
+        }
+
+
+graph = ModelGraph(getattr(settings, 'MODELTREE_GRAPH_CACHE_SIZE', 100))
+
+
+def _clear(**kwargs):
+    # New models may add relations to the models of the trees
+    graph.clear()
+
+
+class_prepared.connect(_clear, dispatch_uid='modeltree.graph')
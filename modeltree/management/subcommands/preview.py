@@ -23,6 +23,9 @@ class Command(BaseCommand):
 
     help = 'Preview the traversal tree for defined ModelTree or bare model.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('args', nargs='*', metavar='alias')
+
     def handle(self, *args, **options):
         if not args:
             alias = MODELTREE_DEFAULT_ALIAS
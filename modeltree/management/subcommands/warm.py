@@ -0,0 +1,42 @@
+from django.core.management import CommandError
+from django.core.management.base import BaseCommand
+from django.core.exceptions import ImproperlyConfigured
+from modeltree.tree import trees
+
+
+class Command(BaseCommand):
+    """
+    SYNOPSIS::
+
+        python manage.py modeltree warm [options] [alias, ...]
+
+    DESCRIPTION:
+
+        Builds the trees of the given aliases or of all aliases defined in
+        the MODELTREES setting and prints the build time and number of
+        nodes of each tree. With MODELTREE_SNAPSHOT_DIR set, this saves the
+        snapshots the trees are loaded from on startup.
+
+    OPTIONS:
+
+        ``--workers`` - builds the trees in parallel on a thread pool of
+        this size.
+
+    """
+
+    help = 'Builds the trees defined in settings ahead of their first use.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('args', nargs='*', metavar='alias')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of threads to build the trees with')
+
+    def handle(self, *args, **options):
+        try:
+            built = trees.warm(args or None, workers=options.get('workers'))
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        for alias in sorted(built):
+            self.stdout.write('{0}: {1} nodes in {2:.3f}s'.format(
+                alias, built[alias]['nodes'], built[alias]['time']))
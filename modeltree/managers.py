@@ -12,3 +12,15 @@ class ModelTreeManager(models.Manager):
 
     def select(self, *args, **kwargs):
         return self.get_queryset().select(*args, **kwargs)
+
+    def semijoin(self, *args, **kwargs):
+        return self.get_queryset().semijoin(*args, **kwargs)
+
+    def cached(self, *args, **kwargs):
+        return self.get_queryset().cached(*args, **kwargs)
+
+    def page(self, *args, **kwargs):
+        return self.get_queryset().page(*args, **kwargs)
+
+    def template(self, *args, **kwargs):
+        return self.get_queryset().template(*args, **kwargs)
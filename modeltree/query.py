@@ -1,7 +1,203 @@
-from django.db.models import query
+import array
+import base64
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import Max, Min, Q, query
+from django.db.models.sql import EmptyResultSet
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
+from modeltree import aio, executor, results
+from modeltree.templates import QueryTemplate
 from modeltree.tree import trees
 from modeltree.utils import M
 
+try:
+    from concurrent.futures import as_completed
+except ImportError:
+    as_completed = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Suffix for the names of server-side cursors
+_cursor_ids = itertools.count()
+
+
+def chunked_cursor(connection):
+    """Returns a cursor which fetches rows from the database as they are
+    requested rather than all at once when the query is executed. This is a
+    named (server-side) cursor on PostgreSQL and a regular cursor on other
+    backends.
+    """
+    # Django 1.11+
+    if hasattr(connection, 'chunked_cursor'):
+        return connection.chunked_cursor()
+
+    if connection.vendor == 'postgresql':
+        connection.ensure_connection()
+
+        name = 'modeltree_{0}_{1}'.format(
+            threading.current_thread().ident, next(_cursor_ids))
+
+        # In autocommit mode the cursor is used outside of a transaction
+        # and must be holdable.
+        return connection.connection.cursor(
+            name, withhold=connection.get_autocommit())
+
+    return connection.cursor()
+
+
+def fetch_chunks(connection, sql, params, chunk_size, col_count=None):
+    """Executes the query with a chunked cursor and yields lists of at most
+    `chunk_size` rows. The cursor is closed once the rows are exhausted or
+    the generator is closed.
+    """
+    cursor = chunked_cursor(connection)
+
+    try:
+        cursor.execute(sql, params)
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+
+            if not rows:
+                break
+
+            # Drop extra columns such as those added for ordering
+            if col_count is not None:
+                rows = [row[:col_count] for row in rows]
+
+            yield rows
+    finally:
+        cursor.close()
+
+
+# Typecode for 64-bit integers. Python 2 does not support 'q', but 'l' is
+# 64 bits wide on the platforms it is used on.
+_INTEGER_TYPECODE = 'q' if 'q' in getattr(array, 'typecodes', '') else 'l'
+
+# Typecodes of the `array.array` buffers used for a column by the internal
+# type of its field. Columns of other types are collected in lists.
+COLUMN_TYPECODES = {
+    'AutoField': _INTEGER_TYPECODE,
+    'BigAutoField': _INTEGER_TYPECODE,
+    'BigIntegerField': _INTEGER_TYPECODE,
+    'IntegerField': _INTEGER_TYPECODE,
+    'PositiveIntegerField': _INTEGER_TYPECODE,
+    'PositiveSmallIntegerField': _INTEGER_TYPECODE,
+    'SmallIntegerField': _INTEGER_TYPECODE,
+    'FloatField': 'd',
+    'BooleanField': 'b',
+}
+
+
+def column_typecode(field):
+    "Returns the typecode of the buffer for values of `field` or None."
+    # Foreign keys hold the values of the field they refer to
+    while field.is_relation and field.concrete:
+        field = field.rel.get_related_field()
+
+    return COLUMN_TYPECODES.get(field.get_internal_type())
+
+
+def fill_columns(rows, typecodes, chunk_size):
+    """Transposes `rows` into one buffer per column, consuming at most
+    `chunk_size` rows at a time. Columns with a typecode are filled into an
+    `array.array` which is replaced by a list if a value does not fit, e.g.
+    a NULL.
+    """
+    columns = [array.array(typecode) if typecode else []
+               for typecode in typecodes]
+
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+
+        if not chunk:
+            break
+
+        for i, values in enumerate(zip(*chunk)):
+            column = columns[i]
+            size = len(column)
+
+            try:
+                column.extend(values)
+            except (TypeError, OverflowError):
+                # The extend may have failed part way through
+                column = column.tolist()[:size]
+                column.extend(values)
+                columns[i] = column
+
+    return columns
+
+
+def to_ndarray(column):
+    "Returns a NumPy array of the values of the column."
+    if isinstance(column, list):
+        values = numpy.empty(len(column), dtype=object)
+        values[:] = column
+        return values
+
+    if not column:
+        values = numpy.empty(0, dtype=column.typecode)
+    else:
+        # Shares the memory of the buffer
+        values = numpy.frombuffer(column, dtype=column.typecode)
+
+    if column.typecode == 'b':
+        return values.view(numpy.bool_)
+
+    return values
+
+
+def partition_ranges(lower, upper, partitions):
+    """Splits the integer range [lower, upper] into at most `partitions`
+    contiguous ranges of about equal size. The bounds are inclusive.
+    """
+    if partitions < 1:
+        raise ValueError('The number of partitions must be at least 1')
+
+    step = max(1, -(-(upper - lower + 1) // partitions))
+
+    return [(start, min(start + step - 1, upper))
+            for start in range(lower, upper + 1, step)]
+
+
+def fetch_partition(query, using):
+    "Returns the rows of `query` as a list of tuples."
+    return list(query.get_compiler(using).results_iter())
+
+
+CURSOR_VERSION = 1
+
+
+def encode_cursor(pk):
+    "Returns an opaque cursor for the page after the root row `pk`."
+    data = json.dumps([CURSOR_VERSION, pk], default=str)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, pk_field):
+    "Returns the root primary key a cursor points after."
+    try:
+        version, pk = json.loads(base64.urlsafe_b64decode(
+            str(cursor)).decode('utf-8'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+    if version != CURSOR_VERSION:
+        raise ValueError('Invalid cursor')
+
+    try:
+        return pk_field.to_python(pk)
+    except ValidationError:
+        raise ValueError('Invalid cursor')
+
 
 class ModelTreeQuerySet(query.QuerySet):
     def __init__(self, model=None, *args, **kwargs):
@@ -9,6 +205,13 @@ class ModelTreeQuerySet(query.QuerySet):
         model = self.tree.root_model
         super(ModelTreeQuerySet, self).__init__(model, *args, **kwargs)
 
+        # Overrides the tree's `semijoin` option if set
+        self._semijoin = None
+
+        # Whether results are cached, see `cached`
+        self._cached = False
+        self._cache_timeout = DEFAULT_TIMEOUT
+
     # Override to ensure no additional modeltrees are created during clone
     def _clone(self, klass=None, setup=False, **kwargs):
         if klass is None:
@@ -28,6 +231,15 @@ class ModelTreeQuerySet(query.QuerySet):
         c = klass(model=model, query=query, using=self._db)
 
         c._for_write = self._for_write
+
+        # Django 1.9+ evaluates values() and values_list() by these
+        if hasattr(self, '_iterable_class') and klass is self.__class__:
+            c._iterable_class = self._iterable_class
+            c._fields = self._fields
+
+        c._semijoin = self._semijoin
+        c._cached = self._cached
+        c._cache_timeout = self._cache_timeout
         c._prefetch_related_lookups = self._prefetch_related_lookups[:]
         c.__dict__.update(kwargs)
 
@@ -37,13 +249,383 @@ class ModelTreeQuerySet(query.QuerySet):
         return c
 
     def _filter_or_exclude(self, negate, *args, **kwargs):
+        condition = M(self.tree, *args, **kwargs)
+
+        if self._uses_semijoin() and (args or kwargs):
+            assert self.query.can_filter(), \
+                'Cannot filter a query once a slice has been taken.'
+
+            clone = self._clone()
+
+            if self.tree.add_exists(clone.query, condition, negate):
+                return clone
+
         return super(ModelTreeQuerySet, self)\
-            ._filter_or_exclude(negate, M(self.tree, *args, **kwargs))
+            ._filter_or_exclude(negate, condition)
+
+    def _uses_semijoin(self):
+        if self._semijoin is None:
+            return bool(self.tree.semijoin)
+
+        return bool(self._semijoin)
+
+    def semijoin(self, enabled=True):
+        """Returns a queryset which filters through many-to-many and reverse
+        foreign key nodes with `EXISTS` subqueries instead of joins, so the
+        root rows are not duplicated. The conditions of a `filter` or
+        `exclude` call which joins such a node are tested together in a
+        single subquery. Conditions only joining to-one nodes are still
+        joined. This overrides the `semijoin` option of the tree.
+        """
+        clone = self._clone()
+        clone._semijoin = enabled
+        return clone
 
     def select(self, *fields, **kwargs):
-        queryset = self._clone()
-        return self.tree.add_select(queryset=queryset, *fields, **kwargs)
+        return self.tree.add_select(queryset=self, *fields, **kwargs)
 
-    def raw(self):
+    def raw(self, chunk_size=None):
+        """Returns an iterator over the rows of the query as tuples.
+
+        If `chunk_size` is set, the rows are streamed from the database
+        `chunk_size` rows at a time so memory use stays bounded regardless
+        of the number of rows. This uses a server-side cursor on PostgreSQL.
+        Other backends use a regular cursor. On SQLite, the database should
+        not be written to on the same connection while the rows are
+        consumed.
+        """
         compiler = self.query.get_compiler(self.db)
-        return compiler.results_iter()
+
+        if not chunk_size:
+            if self._cached:
+                return iter(self._cached_result(
+                    'raw', lambda: list(compiler.results_iter())))
+
+            return compiler.results_iter()
+
+        return self._stream(compiler, chunk_size)
+
+    def template(self, *lookups, **kwargs):
+        """Returns a `modeltree.templates.QueryTemplate` of the query
+        filtered by `lookups`, whose values are given each time the
+        template is run. Selected `fields` are passed to `select` along with
+        the other keyword arguments.
+
+        Templates of the unfiltered query are cached by the tree, keyed by
+        the database, whether conditions are tested with semijoins, the
+        lookups and the selected fields, so a query of the same shape is
+        compiled once.
+        """
+        fields = kwargs.pop('fields', ())
+        queryset = self.select(*fields, **kwargs) if fields else self
+
+        # Only the shape of an unmodified query is known from the key
+        query = self.query
+        pristine = not (query.where.children or query.select or
+                        query.order_by or query.distinct or query.extra or
+                        query.annotations or query.low_mark or
+                        query.high_mark is not None or query.select_related or
+                        query.deferred_loading[0] or
+                        query.group_by is not None or query.distinct_fields)
+
+        if not pristine:
+            return QueryTemplate(queryset, lookups)
+
+        key = (self.db, self._uses_semijoin(), tuple(lookups),
+               tuple(self._field_key(field) for field in fields),
+               tuple(sorted(kwargs.items())))
+
+        template = self.tree.templates.get(key)
+
+        if template is None:
+            template = QueryTemplate(queryset, lookups)
+            self.tree.templates.set(key, template)
+
+        return template
+
+    @staticmethod
+    def _field_key(field):
+        if isinstance(field, (list, tuple)):
+            model, field = field
+        else:
+            model = field.model
+
+        return model._meta.app_label, model._meta.model_name, field.name
+
+    def cached(self, timeout=DEFAULT_TIMEOUT):
+        """Returns a queryset whose `count`, `tree_count` and `raw` results
+        are cached by `modeltree.results` for `timeout` seconds or the
+        cache's default timeout. Results are invalidated when a model of a
+        table of the query is saved or deleted.
+        """
+        clone = self._clone()
+        clone._cached = True
+        clone._cache_timeout = timeout
+        return clone
+
+    def _cached_result(self, kind, func):
+        if not self._cached:
+            return func()
+
+        try:
+            sql, params = self.query.get_compiler(self.db).as_sql()
+        except EmptyResultSet:
+            return func()
+
+        return results.get_or_set(kind, sql, params, self.db, func,
+                                  self._cache_timeout)
+
+    def count(self):
+        return self._cached_result(
+            'count', super(ModelTreeQuerySet, self).count)
+
+    def tree_count(self):
+        """Returns the number of distinct root rows of the query.
+
+        If the query joins a many-to-many or reverse foreign key node, which
+        may duplicate root rows, the root rows are counted through a
+        semi-join on their primary key rather than counting the joined rows
+        with `DISTINCT`.
+        """
+        def count():
+            if not self.tree.query_fans_out(self.query):
+                return self.count()
+
+            return self._roots().count()
+
+        return self._cached_result('tree_count', count)
+
+    def tree_aggregate(self, **aggregates):
+        """Returns a dict of aggregates of fields over the distinct root
+        rows of the query, like `aggregate`. Each value is a pair of an
+        aggregate function, e.g. `Sum`, and a field or a (model, field) pair
+        like for `select`.
+
+        Aggregates of fields whose path does not fan out are computed
+        together. Each of the others is computed in its own query, so the
+        rows of different branches are never multiplied with each other.
+        """
+        if self.tree.query_fans_out(self.query):
+            queryset = self._roots()
+        else:
+            queryset = self._clone()
+
+        groups = [[]]
+
+        for name in sorted(aggregates):
+            field = aggregates[name][1]
+            model = field[0] if isinstance(field, (list, tuple)) \
+                else field.model
+
+            if self.tree.path_fans_out(model):
+                groups.append([name])
+            else:
+                groups[0].append(name)
+
+        results = {}
+
+        for names in groups:
+            if not names:
+                continue
+
+            clone = queryset._clone()
+            joined = {}
+            expressions = {}
+
+            for name in names:
+                function, field = aggregates[name]
+                expressions[name] = function(
+                    self.tree._field_col(clone.query, field, joined))
+
+            results.update(clone.aggregate(**expressions))
+
+        return results
+
+    def tree_annotate(self, **annotations):
+        """Adds a column to the rows of the query for each annotation. The
+        value is an aggregate of a field over the rows related to the root
+        row, computed with a correlated subquery so the root rows are not
+        duplicated. Annotations are specified like for `tree_aggregate` and
+        are selected after the other columns in the order of their names.
+        """
+        clone = self._clone()
+
+        for name in sorted(annotations):
+            function, field = annotations[name]
+
+            clone.query.add_annotation(self.tree.correlated_aggregate(
+                function, field, clone.query), name)
+
+        return clone
+
+    def _roots(self):
+        "Returns a queryset of the distinct root rows of the query."
+        return self.tree.get_queryset().using(self.db)\
+            .filter(pk__in=self.values('pk'))
+
+    def page(self, size, cursor=None):
+        """Returns a page of the rows of the query as a list of tuples and
+        a cursor of the next page, or None if this is the last page.
+
+        Pages are keyed on the root model's primary key rather than an
+        offset, so fetching a page costs the same regardless of how deep it
+        is. A page holds the rows of `size` root rows: all rows of a root
+        row duplicated by many-to-many or reverse foreign key joins are
+        always on the same page. The rows are ordered by the primary key,
+        then by the ordering of the query.
+        """
+        if self.query.low_mark or self.query.high_mark is not None:
+            raise ValueError('Sliced queries cannot be paged')
+
+        pk = self.model._meta.pk
+
+        if self.tree.query_fans_out(self.query):
+            roots = self._roots()
+        else:
+            roots = self._clone()
+
+        if cursor is not None:
+            roots.query.add_q(Q(pk__gt=decode_cursor(cursor, pk)))
+
+        # The primary keys of the root rows on the page and the next one
+        pks = list(roots.order_by('pk')
+                   .values_list('pk', flat=True)[:size + 1])
+
+        if not pks:
+            return [], None
+
+        next_cursor = None
+
+        if len(pks) > size:
+            pks = pks[:size]
+            next_cursor = encode_cursor(pks[-1])
+
+        clone = self._clone()
+        clone.query.add_q(Q(pk__gte=pks[0], pk__lte=pks[-1]))
+
+        ordering = [o for o in clone.query.order_by
+                    if o not in ('pk', '-pk', pk.name, '-' + pk.name)]
+
+        clone.query.clear_ordering(force_empty=True)
+        clone.query.add_ordering('pk', *ordering)
+
+        return list(clone.raw()), next_cursor
+
+    def raw_parallel(self, partitions=None, ordered=True, pool=None):
+        """Returns an iterator over the rows of the query as tuples which
+        are fetched concurrently in `partitions` ranges of the root model's
+        primary key. This requires the primary key to be an integer.
+
+        The partitions are run in the thread pool of `modeltree.executor`,
+        each worker using its own connection, and default to one per worker.
+        A different `concurrent.futures` executor can be passed as `pool`.
+        With a process pool, Django must be set up in the worker processes
+        and connections must not be inherited from the parent.
+
+        If `ordered` is true, the rows are returned in the order of the
+        partitions, so a query ordered by the primary key stays ordered.
+        Otherwise the rows of each partition are returned as soon as it is
+        fetched.
+        """
+        pk = self.model._meta.pk
+
+        if column_typecode(pk) != _INTEGER_TYPECODE:
+            raise ValueError('Only queries on models with an integer '
+                             'primary key can be partitioned')
+
+        if self.query.low_mark or self.query.high_mark is not None:
+            raise ValueError('Sliced queries cannot be partitioned')
+
+        if partitions is None:
+            partitions = getattr(settings, 'MODELTREE_WORKERS',
+                                 executor.DEFAULT_WORKERS)
+
+        if partitions < 1:
+            raise ValueError('The number of partitions must be at least 1')
+
+        bounds = self.aggregate(lower=Min('pk'), upper=Max('pk'))
+
+        if bounds['lower'] is None:
+            return iter([])
+
+        futures = []
+
+        for lower, upper in partition_ranges(bounds['lower'],
+                                             bounds['upper'], partitions):
+            query = self.query.clone()
+            query.add_q(Q(pk__gte=lower, pk__lte=upper))
+
+            if pool is None:
+                future = executor.submit(self.db, fetch_partition, query,
+                                         self.db)
+            else:
+                future = pool.submit(executor.call, self.db, fetch_partition,
+                                     query, self.db)
+
+            futures.append(future)
+
+        if not ordered:
+            futures = as_completed(futures)
+
+        return itertools.chain.from_iterable(f.result() for f in futures)
+
+    def columns(self, chunk_size=2000, ndarray=False):
+        """Returns the values of the query as one sequence per selected
+        column rather than one tuple per row.
+
+        Integer, float and boolean columns are filled into typed
+        `array.array` buffers. Columns of other types, or which contain
+        NULLs, are returned as lists. The rows are fetched `chunk_size` at a
+        time.
+
+        If `ndarray` is true, the columns are returned as NumPy arrays. This
+        requires NumPy to be installed.
+        """
+        if ndarray and numpy is None:
+            raise ImproperlyConfigured('NumPy must be installed to return '
+                                       'columns as arrays')
+
+        compiler = self.query.get_compiler(self.db)
+        rows = self._stream(compiler, chunk_size)
+
+        typecodes = [column_typecode(expr.output_field)
+                     for expr, _, _ in compiler.select]
+
+        columns = fill_columns(rows, typecodes, chunk_size)
+
+        if ndarray:
+            return [to_ndarray(column) for column in columns]
+
+        return columns
+
+    def acount(self):
+        """Returns an awaitable of the result of `count()`. The query runs
+        in the thread pool of `modeltree.executor`.
+        """
+        return aio.run(self.db, self.count)
+
+    def aselect(self, *fields, **kwargs):
+        """Returns an awaitable of the rows of `select(*fields)` as a list
+        of tuples. The query runs in the thread pool of `modeltree.executor`.
+        """
+        queryset = self.select(*fields, **kwargs)
+        return aio.run(self.db, lambda: list(queryset.raw()))
+
+    def araw(self, chunk_size=GET_ITERATOR_CHUNK_SIZE):
+        """Returns an asynchronous iterator over the rows of the query as
+        tuples, for use with `async for`. The rows are fetched `chunk_size`
+        at a time by a thread of the iterator, see `modeltree.aio`.
+        """
+        return aio.AsyncRows(self, chunk_size)
+
+    def _stream(self, compiler, chunk_size):
+        try:
+            sql, params = compiler.as_sql()
+        except EmptyResultSet:
+            return iter([])
+
+        chunks = fetch_chunks(compiler.connection, sql, params, chunk_size,
+                              compiler.col_count)
+
+        # Applies the backend's value converters to each row
+        return compiler.results_iter(chunks)
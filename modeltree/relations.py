@@ -0,0 +1,125 @@
+from collections import namedtuple
+
+from django.apps import apps
+
+__all__ = ('Relation', 'RelationIndex', 'relations')
+
+
+class Relation(namedtuple('Relation', (
+        'source', 'target', 'relation', 'reverse', 'related_name',
+        'accessor_name', 'nullable', 'field', 'join_field'))):
+    """A typed edge from one model to a related model.
+
+        `source` - the model the relation is defined relative to. For
+        inherited fields this is the parent model.
+
+        `target` - the related model
+
+        `relation` - the _kind_ of relationship, 'manytomany', 'onetone' or
+        'foreignkey'
+
+        `reverse` - whether the relation is derived from a field that lives
+        on the target model
+
+        `related_name` - the query string representation used when querying
+        via the ORM
+
+        `accessor_name` - the attribute name on the source model
+
+        `nullable` - whether the relationship is nullable
+
+        `field` - the concrete field that defines the relationship
+
+        `join_field` - the field or relation object the join is made on
+    """
+    __slots__ = ()
+
+
+def get_relation_type(f):
+    if f.one_to_one:
+        return 'onetone'
+    elif f.many_to_many:
+        return 'manytomany'
+    elif f.one_to_many or f.many_to_one:
+        return 'foreignkey'
+
+
+class RelationIndex(object):
+    """A process-wide index of the relations of each model in the app
+    registry. Relations are derived once per model and shared by every
+    `ModelTree`. An entry is rederived if Django expires the model's field
+    cache, e.g. when a new related model is registered.
+    """
+    def __init__(self, registry=None):
+        self.registry = registry or apps
+        self._relations = {}
+
+    def __getitem__(self, model):
+        fields = model._meta.get_fields()
+        entry = self._relations.get(model)
+
+        if entry is None or entry[0] is not fields:
+            entry = (fields, self._derive(fields))
+            self._relations[model] = entry
+
+        return entry[1]
+
+    def __contains__(self, model):
+        return model in self._relations
+
+    def __len__(self):
+        return len(self._relations)
+
+    def _derive(self, fields):
+        # NOTE: the many-to-many relations are evaluated first to prevent
+        # 'through' models being bound as a ForeignKey relationship.
+        fields = sorted(fields, reverse=True,
+                        key=lambda f: bool(f.many_to_many))
+
+        relations = []
+
+        # Forward relations
+        for f in fields:
+            if (f.one_to_one or f.many_to_many or f.many_to_one) \
+                    and (f.concrete or not f.auto_created) \
+                    and f.rel is not None:  # Generic foreign keys
+                relations.append(Relation(
+                    source=f.model,
+                    target=f.rel.to,
+                    relation=get_relation_type(f),
+                    reverse=False,
+                    related_name=f.name,
+                    accessor_name=f.name,
+                    nullable=bool(f.many_to_many or f.null),
+                    field=f,
+                    join_field=f,
+                ))
+
+        # Reverse relations
+        for r in fields:
+            if (r.one_to_many or r.one_to_one or r.many_to_many) \
+                    and (not r.concrete and r.auto_created):
+                relations.append(Relation(
+                    source=r.model,
+                    target=r.related_model,
+                    relation=get_relation_type(r),
+                    reverse=True,
+                    related_name=r.field.related_query_name(),
+                    accessor_name=r.get_accessor_name(),
+                    nullable=True,
+                    field=r.field,
+                    join_field=r,
+                ))
+
+        return tuple(relations)
+
+    def build(self):
+        "Eagerly indexes all models in the app registry."
+        for model in self.registry.get_models():
+            self[model]
+
+    def clear(self):
+        self._relations.clear()
+
+
+relations = RelationIndex()
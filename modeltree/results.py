@@ -0,0 +1,216 @@
+"""A cache of query results which is invalidated by model signals.
+
+Entries are keyed by the compiled SQL of a query, its parameters and the
+current generation of each table the SQL refers to. Saving or deleting a
+model, or changing a many-to-many relation, starts a new generation of the
+affected tables, so entries of queries on those tables are no longer found
+and expire from the cache. Results of queries on tables changed by the
+current transaction are not cached, since it may be rolled back. On Django
+1.8, which has no commit hooks, no results are cached within transactions.
+
+The cache is the one named by the `MODELTREE_RESULT_CACHE` setting or a
+local-memory cache by default. Changes which do not send signals, e.g.
+`QuerySet.update`, must be followed by a call to `invalidate`.
+"""
+import hashlib
+import threading
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from modeltree.cache import LRUCache
+
+__all__ = ('get_cache', 'get_or_set', 'invalidate', 'connect')
+
+KEY_PREFIX = 'modeltree'
+
+_cache = None
+_connected = False
+_lock = threading.Lock()
+
+# Tables referred to by each compiled SQL string
+_sql_tables = LRUCache(1000)
+
+# Changes of the current transaction of each database, per thread
+_changes = threading.local()
+
+
+def get_cache():
+    "Returns the cache of the results."
+    global _cache
+
+    if _cache is None:
+        alias = getattr(settings, 'MODELTREE_RESULT_CACHE', None)
+
+        if alias:
+            _cache = caches[alias]
+        else:
+            _cache = LocMemCache('modeltree', {})
+
+    return _cache
+
+
+def _generation_key(table):
+    return '{0}:generation:{1}'.format(KEY_PREFIX, table)
+
+
+def _tables(sql, using):
+    "Returns the names of the tables of the models referred to by `sql`."
+    key = (using, sql)
+    tables = _sql_tables.get(key)
+
+    if tables is None:
+        quote_name = connections[using].ops.quote_name
+
+        tables = tuple(sorted(set(
+            model._meta.db_table
+            for model in apps.get_models(include_auto_created=True)
+            if quote_name(model._meta.db_table) in sql)))
+
+        _sql_tables.set(key, tables)
+
+    return tables
+
+
+def _model_tables(model):
+    tables = [model._meta.db_table]
+    tables.extend(parent._meta.db_table
+                  for parent in model._meta.get_parent_list())
+    return tables
+
+
+def _transaction_changes(using):
+    """Returns the list of the changes made by the current transaction on
+    the database `using` as pairs of a commit hook and the changed tables.
+    """
+    if not hasattr(_changes, 'changes'):
+        _changes.changes = {}
+
+    changes = _changes.changes.setdefault(using, [])
+
+    # The hooks of changes which were committed or rolled back, also to a
+    # savepoint, are no longer pending
+    pending = set(id(func) for sids, func in
+                  connections[using].run_on_commit)
+    changes[:] = [change for change in changes if id(change[0]) in pending]
+
+    return changes
+
+
+def _cacheable(tables, using):
+    """Returns whether results of queries on `tables` can be cached, i.e.
+    the current transaction on the database `using` has no changes of the
+    tables, which may still be rolled back.
+    """
+    connection = connections[using]
+
+    if not connection.in_atomic_block:
+        return True
+
+    # Django 1.8 has no commit hooks, so the changes of a transaction are
+    # not known
+    if not hasattr(connection, 'run_on_commit'):
+        return False
+
+    return not any(set(tables).intersection(changed)
+                   for hook, changed in _transaction_changes(using))
+
+
+def _generations(cache, tables):
+    keys = [_generation_key(table) for table in tables]
+    generations = cache.get_many(keys)
+
+    for key in keys:
+        if key not in generations:
+            # A new generation is unique, so entries from before a
+            # generation was evicted are never found again.
+            cache.add(key, uuid.uuid4().hex, None)
+            generations[key] = cache.get(key)
+
+    return [generations[key] for key in keys]
+
+
+def get_or_set(kind, sql, params, using, func, timeout=DEFAULT_TIMEOUT):
+    """Returns the cached result of `func` for the query of `sql` and
+    `params` on the database `using`. `kind` distinguishes the results of
+    different evaluations of the same query, e.g. a count.
+    """
+    connect()
+
+    cache = get_cache()
+    tables = _tables(sql, using)
+
+    key = '{0}:result:{1}'.format(KEY_PREFIX, hashlib.sha1(repr(
+        (kind, using, sql, tuple(params), _generations(cache, tables))
+    ).encode('utf-8')).hexdigest())
+
+    # Results are wrapped so a result of None can be cached
+    entry = cache.get(key)
+
+    if entry is None:
+        entry = (func(),)
+
+        if _cacheable(tables, using):
+            cache.set(key, entry, timeout)
+
+    return entry[0]
+
+
+def invalidate(*models):
+    "Invalidates the cached results of queries on the tables of `models`."
+    cache = get_cache()
+
+    for model in models:
+        for table in _model_tables(model):
+            cache.set(_generation_key(table), uuid.uuid4().hex, None)
+
+
+def _changed(model, using):
+    invalidate(model)
+
+    if not connections[using].in_atomic_block:
+        return
+
+    # Results of queries run between the signal and the commit of the
+    # transaction would otherwise be cached with the new generation.
+    def hook():
+        invalidate(model)
+
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(hook, using=using)
+        _transaction_changes(using).append((hook, _model_tables(model)))
+
+
+def _saved_or_deleted(sender, using=None, **kwargs):
+    _changed(sender, using)
+
+
+def _m2m_changed(sender, action, using=None, **kwargs):
+    if action.startswith('post_'):
+        _changed(sender, using)
+
+
+def connect():
+    """Connects the signal handlers which invalidate results. This is done
+    on startup by `modeltree.apps.ModelTreeConfig`, and when a result is
+    first cached if the app config is not used.
+    """
+    global _connected
+
+    if _connected:
+        return
+
+    with _lock:
+        if not _connected:
+            post_save.connect(_saved_or_deleted,
+                              dispatch_uid='modeltree.results.save')
+            post_delete.connect(_saved_or_deleted,
+                                dispatch_uid='modeltree.results.delete')
+            m2m_changed.connect(_m2m_changed,
+                                dispatch_uid='modeltree.results.m2m')
+            _connected = True
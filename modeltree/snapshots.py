@@ -0,0 +1,138 @@
+"""Persistent snapshots of built trees.
+
+A snapshot is a JSON file holding the nodes of a tree in breadth-first
+order. Snapshots are keyed by a fingerprint of the model metadata the tree
+is built from and the tree's route configuration, so a snapshot written
+before a schema or configuration change is never loaded.
+"""
+import errno
+import hashlib
+import json
+import os
+import tempfile
+
+from django.apps import apps
+from django.db.models.signals import class_prepared
+from modeltree.relations import relations
+
+SNAPSHOT_VERSION = 1
+
+# Digest of the model metadata of the app registry. This is reset when a
+# model is registered.
+_schema_digest = None
+
+
+def _reset_schema_digest(**kwargs):
+    global _schema_digest
+    _schema_digest = None
+
+
+class_prepared.connect(_reset_schema_digest,
+                       dispatch_uid='modeltree.snapshots')
+
+
+def model_label(model):
+    return '{0}.{1}'.format(model._meta.app_label, model._meta.object_name)
+
+
+def field_label(field):
+    if field is None:
+        return None
+    return '{0}.{1}'.format(model_label(field.model), field.name)
+
+
+def schema_digest():
+    "Returns a digest of the model metadata relevant to building trees."
+    global _schema_digest
+
+    if _schema_digest is None:
+        digest = hashlib.sha1()
+
+        for model in sorted(apps.get_models(), key=model_label):
+            meta = [model_label(model), model._meta.db_table,
+                    model._meta.pk.column]
+
+            for r in relations[model]:
+                meta.append([model_label(r.source), model_label(r.target),
+                             r.relation, r.reverse, r.related_name,
+                             r.accessor_name, r.nullable,
+                             field_label(r.field)])
+
+            digest.update(json.dumps(meta).encode('utf-8'))
+
+        _schema_digest = digest.hexdigest()
+
+    return _schema_digest
+
+
+def fingerprint(tree):
+    """Returns a fingerprint of the schema and of the class and the
+    configuration of the tree.
+    """
+    def routes(joins):
+        return sorted([model_label(source), model_label(target),
+                       field_label(field)]
+                      for (source, target), field in joins.items())
+
+    config = [
+        SNAPSHOT_VERSION,
+        schema_digest(),
+        # Subclasses may traverse the relations differently
+        '{0}.{1}'.format(tree.__class__.__module__, tree.__class__.__name__),
+        model_label(tree.root_model),
+        sorted(model_label(model) for model in tree.excluded_models),
+        routes(tree._required_joins),
+        routes(tree._excluded_joins),
+        sorted([model_label(source), model_label(target), field_label(field),
+                cost]
+               for (source, target), costs in tree._route_costs.items()
+               for field, cost in costs.items()),
+    ]
+
+    # Paths chosen by costs depend on the statistics of the joined tables
+    if tree.cost_model is not None:
+        config.append(tree.cost_model.digest(tree._reachable_relations()))
+
+    return hashlib.sha1(json.dumps(config).encode('utf-8')).hexdigest()
+
+
+def snapshot_path(directory, tree):
+    return os.path.join(directory, '{0}.json'.format(fingerprint(tree)))
+
+
+def read(path):
+    "Returns the data of the snapshot at `path` or None if it is unusable."
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return
+
+    if not isinstance(data, dict) or \
+            data.get('version') != SNAPSHOT_VERSION:
+        return
+
+    return data
+
+
+def write(path, data):
+    """Writes a snapshot atomically so concurrent readers never see a
+    partially written file.
+    """
+    directory = os.path.dirname(path)
+
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.rename(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
@@ -0,0 +1,82 @@
+"""Subqueries which are correlated to the root rows of an outer query.
+
+The subqueries are queries of the root model and are correlated on its
+primary key. They are compiled together with the outer query so they follow
+its aliases, e.g. when the outer query is itself used as a subquery.
+"""
+from django.db.models.expressions import Expression
+from django.db.models.sql.datastructures import BaseTable
+from django.db.models.sql.where import AND, ExtraWhere
+
+__all__ = ('correlate', 'Exists', 'CorrelatedAggregate')
+
+
+def base_alias(query):
+    "Returns the alias of the base table of `query`."
+    return next(alias for alias, table in query.alias_map.items()
+                if isinstance(table, BaseTable))
+
+
+def correlate(inner, outer_query, outer_alias, connection):
+    """Returns the SQL and parameters of the query `inner` restricted to
+    the root row of `outer_alias` in `outer_query`. The aliases of the
+    subquery are renamed so they do not clash with the ones of the outer
+    query. `inner` is not modified.
+    """
+    inner = inner.clone()
+    inner.bump_prefix(outer_query)
+
+    qn = connection.ops.quote_name
+    pk_column = qn(inner.get_meta().pk.column)
+
+    inner.where.add(ExtraWhere(['{0}.{1} = {2}.{1}'.format(
+        qn(base_alias(inner)), pk_column, qn(outer_alias))], []), AND)
+
+    return inner.get_compiler(connection=connection).as_sql()
+
+
+class Exists(object):
+    """A condition of a where clause which tests whether the subquery
+    `query` has any rows for the root row of `alias`.
+    """
+    contains_aggregate = False
+
+    def __init__(self, query, alias, negated=False):
+        self.query = query
+        self.alias = alias
+        self.negated = negated
+
+    def as_sql(self, compiler, connection):
+        sql, params = correlate(self.query, compiler.query, self.alias,
+                                connection)
+
+        if self.negated:
+            return 'NOT EXISTS ({0})'.format(sql), params
+
+        return 'EXISTS ({0})'.format(sql), params
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(self.query,
+                              change_map.get(self.alias, self.alias),
+                              self.negated)
+
+
+class CorrelatedAggregate(Expression):
+    """An expression of the subquery `query`, which selects an aggregate,
+    over the rows related to the root row of `alias`.
+    """
+    def __init__(self, query, alias, output_field=None):
+        super(CorrelatedAggregate, self).__init__(output_field=output_field)
+        self.query = query
+        self.alias = alias
+
+    def as_sql(self, compiler, connection):
+        sql, params = correlate(self.query, compiler.query, self.alias,
+                                connection)
+
+        return '({0})'.format(sql), params
+
+    def relabeled_clone(self, change_map):
+        clone = self.copy()
+        clone.alias = change_map.get(self.alias, self.alias)
+        return clone
@@ -0,0 +1,187 @@
+"""Compiled query templates for queries which are run repeatedly with
+different values.
+
+A template resolves its lookups and plans its joins once, with a
+placeholder for the value of each of its parameter lookups. The SQL is
+compiled when the template is first run. Later runs only compile the
+parameter lookups with their new values and substitute the parameters of
+those lookups into the compiled SQL.
+"""
+import copy
+import threading
+
+from django.db import connections
+from django.db.models.expressions import Expression
+from django.db.models.sql.where import WhereNode
+
+__all__ = ('Parameter', 'QueryTemplate')
+
+
+class Parameter(Expression):
+    "Placeholder for the value of the lookup `name` of a template."
+    def __init__(self, name):
+        super(Parameter, self).__init__()
+        self.name = name
+
+    def as_sql(self, compiler, connection):
+        raise ValueError('The template parameter "{0}" has no value'
+                         .format(self.name))
+
+
+class Slot(object):
+    """A parameter of the compiled SQL of a template, the `index`th one of
+    the lookup of the parameter `name` as compiled by `compiler`.
+    """
+    def __init__(self, name, index, lookup, compiler, sql):
+        self.name = name
+        self.index = index
+        self.lookup = lookup
+        self.compiler = compiler
+        self.sql = sql
+
+
+class Binding(object):
+    """A condition of a where clause which compiles `lookup`, the lookup of
+    the parameter `name` with a value, and marks its parameters as slots.
+    """
+    contains_aggregate = False
+
+    def __init__(self, name, lookup):
+        self.name = name
+        self.lookup = lookup
+
+    def as_sql(self, compiler, connection):
+        sql, params = compiler.compile(self.lookup)
+        return sql, [Slot(self.name, i, self.lookup, compiler, sql)
+                     for i in range(len(params))]
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(self.name,
+                              self.lookup.relabeled_clone(change_map))
+
+
+def bind(where, values):
+    """Returns a copy of the where clause `where` in which the lookups of
+    parameters are bound to their `values`.
+    """
+    children = []
+
+    for child in where.children:
+        if isinstance(child, WhereNode):
+            child = bind(child, values)
+        elif isinstance(getattr(child, 'rhs', None), Parameter):
+            name = child.rhs.name
+            child = Binding(name, child.__class__(child.lhs, values[name]))
+        elif hasattr(child, 'query'):
+            # Conditions of `EXISTS` subqueries, see `modeltree.subqueries`
+            inner = child.query.clone()
+            inner.where = bind(inner.where, values)
+            child = copy.copy(child)
+            child.query = inner
+
+        children.append(child)
+
+    return where.__class__(children, where.connector, where.negated)
+
+
+class QueryTemplate(object):
+    """A query of `queryset` filtered by `lookups`, whose values are given
+    each time it is run, e.g.::
+
+        template = QueryTemplate(queryset, ['salary__gt'])
+        rows = template.raw(salary__gt=10000)
+
+    A value must not change the SQL of its lookup, e.g. the values of an
+    `in` lookup must have the same length, and must not be None.
+    """
+    def __init__(self, queryset, lookups):
+        self.using = queryset.db
+        self.lookups = tuple(lookups)
+
+        self.query = queryset.filter(**dict(
+            (lookup, Parameter(lookup)) for lookup in self.lookups)).query
+
+        self._compiled = None
+        self._lock = threading.Lock()
+
+    def _compile(self, values):
+        query = self.query.clone()
+
+        query.where = bind(query.where, values)
+
+        compiler = query.get_compiler(self.using)
+        sql, params = compiler.as_sql()
+
+        slots = [(i, param) for i, param in enumerate(params)
+                 if isinstance(param, Slot)]
+
+        # The SQL of a lookup without parameters, e.g. `isnull`, depends on
+        # its value
+        missing = set(self.lookups).difference(
+            slot.name for i, slot in slots)
+
+        if missing:
+            raise ValueError('Lookups cannot be template parameters: '
+                             '{0}'.format(', '.join(sorted(missing))))
+
+        return compiler, sql, tuple(params), slots
+
+    def as_sql(self, **values):
+        """Returns the compiler, SQL and parameters of the query for the
+        values of the lookups.
+        """
+        missing = set(self.lookups).difference(values)
+
+        if missing:
+            raise TypeError('Missing values for lookups: {0}'.format(
+                ', '.join(sorted(missing))))
+
+        for name in self.lookups:
+            if values[name] is None:
+                raise ValueError('The value of "{0}" cannot be None'
+                                 .format(name))
+
+        if self._compiled is None:
+            with self._lock:
+                if self._compiled is None:
+                    self._compiled = self._compile(values)
+
+        compiler, sql, params, slots = self._compiled
+        params = list(params)
+        bound = {}
+
+        for i, slot in slots:
+            key = id(slot.lookup)
+
+            if key not in bound:
+                lookup = slot.lookup
+                # The compiler of a subquery knows the aliases of its
+                # tables
+                bound[key] = slot.compiler.compile(
+                    lookup.__class__(lookup.lhs, values[slot.name]))
+
+                if bound[key][0] != slot.sql:
+                    raise ValueError('The value of "{0}" changes the SQL '
+                                     'of the template'.format(slot.name))
+
+            params[i] = bound[key][1][slot.index]
+
+        return compiler, sql, params
+
+    def raw(self, **values):
+        """Runs the query with the values of the lookups and returns an
+        iterator over the rows as tuples.
+        """
+        compiler, sql, params = self.as_sql(**values)
+
+        # The connection of the compiler belongs to the thread which first
+        # ran the template
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        if compiler.col_count is not None:
+            rows = [row[:compiler.col_count] for row in rows]
+
+        # Applies the backend's value converters to each row
+        return compiler.results_iter([rows])
@@ -1,16 +1,33 @@
+import heapq
 import inspect
+import itertools
+import os
+import threading
+import time
 import warnings
+from collections import OrderedDict, deque
 
 import six
+from six.moves import intern
 from django.apps import apps
-from django.db import models
+from django.db import connections, models
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.db.models import Q, ManyToManyRel, ManyToOneRel
 from django.db.models.expressions import Col
 from django.db.models.sql.constants import INNER, LOUTER
 from django.db.models.sql.datastructures import Join, BaseTable
+from django.db.models.sql.where import AND
 from django.utils.datastructures import MultiValueDict
+from modeltree import costs, snapshots, subqueries
+from modeltree.cache import LRUCache
+from modeltree.graph import graph
+from modeltree.relations import relations
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
 
 __all__ = ('ModelTree',)
 
@@ -40,6 +57,11 @@ class ModelNotRelated(ModelLookupError):
 
 @six.python_2_unicode_compatible
 class ModelTreeNode(object):
+    # Nodes are numerous on large schemas, so they have no `__dict__`. The
+    # names of the model are read from its options rather than copied.
+    __slots__ = ('model', 'parent', 'relation', 'reverse', 'related_name',
+                 'accessor_name', 'nullable', 'depth', 'children', '_joins')
+
     def __init__(self, model, parent=None, relation=None, reverse=None,
                  related_name=None, accessor_name=None, nullable=False,
                  depth=0):
@@ -74,25 +96,52 @@ class ModelTreeNode(object):
         """
 
         self.model = model
-
-        self.app_name = model._meta.app_label
-        self.model_name = model._meta.object_name
-        self.db_table = model._meta.db_table
-        self.pk_column = model._meta.pk.column
-
         self.parent = parent
-        self.parent_model = parent and parent.model or None
 
-        self.relation = relation
+        # The names are shared by the nodes of all trees
+        self.relation = relation and intern(str(relation))
         self.reverse = reverse
 
-        self.related_name = related_name
-        self.accessor_name = accessor_name
+        self.related_name = related_name and intern(str(related_name))
+        self.accessor_name = accessor_name and intern(str(accessor_name))
         self.nullable = nullable
         self.depth = depth
 
         self.children = []
 
+        # Join templates, see `_compile_joins`
+        self._joins = None
+
+    # Classes with `__slots__` are only pickled by the newer protocols by
+    # default
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def parent_model(self):
+        parent = self.parent
+        return parent and parent.model or None
+
+    @property
+    def app_name(self):
+        return self.model._meta.app_label
+
+    @property
+    def model_name(self):
+        return self.model._meta.object_name
+
+    @property
+    def db_table(self):
+        return self.model._meta.db_table
+
+    @property
+    def pk_column(self):
+        return self.model._meta.pk.column
+
     def __str__(self):
         name = 'ModelTreeNode: {0}'.format(self.model_name)
 
@@ -104,6 +153,14 @@ class ModelTreeNode(object):
     def __repr__(self):
         return '<{0}>'.format(self)
 
+    @property
+    def fans_out(self):
+        """Whether a row of the parent model may be related to more than
+        one row of this model, i.e. joining this node may duplicate rows.
+        """
+        return self.relation == 'manytomany' or \
+            (self.reverse and self.relation == 'foreignkey')
+
     @property
     def m2m_db_table(self):
         related_field = self.parent_model._meta.get_field(self.related_name)
@@ -112,57 +169,49 @@ class ModelTreeNode(object):
         else:
             return related_field.m2m_db_table()
 
-    def get_joins(self):
-        """Returns a BaseTable and a list of Join objects that need to be added
-        to a QuerySet object that properly joins this model and the parent.
+    def _compile_joins(self):
+        """Computes the arguments of the joins between the parent model and
+        this model. Queries modify the `Join` objects they are given, so
+        these are kept as immutable templates and `get_joins` creates new
+        objects from them.
         """
-        # These arguments should match the spec of the Join object.
+        # These arguments should match the spec of the Join object, i.e.
+        # table_name, parent_alias, table_alias, join_type, join_field and
+        # nullable.
         # See https://github.com/django/django/blob/1.8.7/django/db/models/sql/query.py#L896  # noqa
-        join_args = {
-            'table_name': None,
-            'parent_alias': None,
-            'table_alias': None,
-            'join_type': None,
-            'join_field': None,
-            'nullable': self.nullable,
-        }
-
-        joins = []
-
         related_field = self.parent_model._meta.get_field(self.related_name)
+
         # Setup two connections for m2m.
         if self.relation == 'manytomany':
             path = related_field.get_path_info()
 
-            copy1 = join_args.copy()
-            copy1.update({
-                'join_field': path[0].join_field,
-                'parent_alias': self.parent.db_table,
-                'table_name': self.m2m_db_table,
-                'join_type': LOUTER,
-            })
-
-            copy2 = join_args.copy()
-            copy2.update({
-                'join_field': path[1].join_field,
-                'parent_alias': self.m2m_db_table,
-                'table_name': self.db_table,
-                'join_type': LOUTER,
-            })
-            joins.append(Join(**copy1))
-            joins.append(Join(**copy2))
+            if self.reverse:
+                m2m_db_table = related_field.field.m2m_db_table()
+            else:
+                m2m_db_table = related_field.m2m_db_table()
+
+            self._joins = (
+                (m2m_db_table, self.parent.db_table, None, LOUTER,
+                 path[0].join_field, self.nullable),
+                (self.db_table, m2m_db_table, None, LOUTER,
+                 path[1].join_field, self.nullable),
+            )
         else:
-            copy = join_args.copy()
-            copy.update({
-                'table_name': self.db_table,
-                'parent_alias': self.parent.db_table,
-                'join_field': related_field,
-                'join_type': LOUTER if self.nullable else INNER,
-            })
+            self._joins = (
+                (self.db_table, self.parent.db_table, None,
+                 LOUTER if self.nullable else INNER, related_field,
+                 self.nullable),
+            )
 
-            joins.append(Join(**copy))
+    def get_joins(self):
+        """Returns a BaseTable and a list of Join objects that need to be added
+        to a QuerySet object that properly joins this model and the parent.
+        """
+        if self._joins is None:
+            self._compile_joins()
 
-        return BaseTable(self.parent.db_table, alias=None), joins
+        return (BaseTable(self.parent.db_table, alias=None),
+                [Join(*args) for args in self._joins])
 
     def remove_child(self, model):
         "Removes a child node for a given model."
@@ -243,6 +292,22 @@ class ModelTree(object):
         An excluded route is more obvious: joining from the specified source
         model to the specified target model is not allowed.
 
+        A modeltree config can also have `route_costs`, a list of routes in
+        the above format with an additional `cost`. The tree is built from
+        the shortest paths where each join counts as one plus the cost of
+        its route, so a costly route is only used if no other path of about
+        the same length exists. Routes without a cost count as zero. For
+        example, a cost of 2 makes a join through an audit table count as
+        three joins.
+
+        `statistics` - Chooses the cheapest of paths of equal length rather
+        than the one traversed first. The cost of a join is estimated from
+        the number of rows of the joined tables, whether the joined columns
+        are indexed and whether it is an outer join. Set this to true to use
+        statistics of the default database, to the alias of a database, or
+        to a statistics object, see `modeltree.costs`. Routes still take
+        priority.
+
     """                                                           # noqa: W605
     def __init__(self, model=None, **kwargs):
         if model is None and 'root_model' in kwargs:
@@ -273,6 +338,32 @@ class ModelTree(object):
         self.root_model = self.get_model(model, local=False)
         self.alias = kwargs.get('alias', None)
 
+        # Directory of tree snapshots to load from and save to
+        self.snapshot_dir = kwargs.get('snapshot_dir', None)
+
+        # Memo of resolved lookups, see `modeltree.utils.resolve_lookup`
+        self.lookup_cache = LRUCache(kwargs.get(
+            'lookup_cache_size',
+            getattr(settings, 'MODELTREE_LOOKUP_CACHE_SIZE', 1000)))
+
+        # Compiled templates of queries, see `ModelTreeQuerySet.template`
+        self.templates = LRUCache(kwargs.get(
+            'template_cache_size',
+            getattr(settings, 'MODELTREE_TEMPLATE_CACHE_SIZE', 100)))
+
+        # Compile all short-form lookups on first use, see
+        # `modeltree.utils.compile_lookups`
+        self.precompile_lookups = kwargs.get('precompile_lookups', False)
+        self._lookups = None
+
+        # Chooses the cheapest of paths of equal length by the statistics
+        # of the joined tables, see `modeltree.costs`
+        self.cost_model = self._build_cost_model(kwargs.get('statistics'))
+
+        # Filter through many-to-many and reverse foreign key nodes with
+        # `EXISTS` subqueries rather than joins, see `add_exists`
+        self.semijoin = kwargs.get('semijoin', False)
+
         # Models completely excluded from the tree
         self.excluded_models = [self.get_model(label, local=False)
                                 for label in excluded_models]
@@ -285,7 +376,13 @@ class ModelTree(object):
         # Build the routes that are excluded
         self._excluded_joins = self._build_routes(excluded_routes)
 
-        # cache each node relative their models
+        # Build the additional costs of routes
+        self._route_costs = self._build_route_costs(
+            kwargs.get('route_costs'))
+
+        self._compile_routes()
+
+        # cache each node by its model
         self._nodes = {}
 
         # cache all app names relative to their model names i.e. supporting
@@ -295,6 +392,9 @@ class ModelTree(object):
         # cache (app, model) pairs with the respective model class
         self._models = {}
 
+        # The state shared with trees of the same policy, see `_build`
+        self._plan = None
+
         self._build()
 
     def __repr__(self):
@@ -407,6 +507,21 @@ class ModelTree(object):
             model = self.root_model
         return model._meta.get_field(name)
 
+    def _build_cost_model(self, statistics):
+        """Returns a cost model for the `statistics` option, which is either
+        true to use statistics of the default database, the alias of a
+        database or an object with `row_count` and `is_indexed` methods.
+        """
+        if not statistics:
+            return
+
+        if statistics is True:
+            statistics = costs.database_statistics()
+        elif isinstance(statistics, six.string_types):
+            statistics = costs.database_statistics(statistics)
+
+        return costs.CostModel(statistics)
+
     def _build_routes(self, routes, allow_redundant_targets=True):
         """Routes provide a means of specifying JOINs between two tables.
 
@@ -482,50 +597,135 @@ class ModelTree(object):
 
         return joins
 
-    def _join_allowed(self, source, target, field=None):
-        """Checks if the join between `source` and `target` via `field`
-        is allowed.
+    def _build_route_costs(self, routes):
+        """Returns a dict of the costs of routes by (source, target) pair.
+        Each value is a dict of costs by join field, where None applies to
+        all fields. Routes are defined as for `_build_routes` with an
+        additional `cost`.
         """
-        join = (source, target)
+        costs = {}
+
+        for route in routes or ():
+            cost = route.get('cost', 0)
+
+            if not isinstance(cost, six.integer_types + (float,)) or \
+                    cost < 0:
+                raise ValueError('The cost of a route must be a '
+                                 'non-negative number')
 
+            for join, field in self._build_routes([route]).items():
+                costs.setdefault(join, {})[field] = cost
+
+        return costs
+
+    def _route_cost(self, source, target, field=None):
+        "Returns the additional cost of joining `source` to `target`."
+        costs = self._route_costs.get((source, target))
+
+        if not costs:
+            return 0
+
+        if field in costs:
+            return costs[field]
+
+        return costs.get(None, 0)
+
+    def _compile_routes(self):
+        """Indexes the route configuration so each join check is a constant
+        number of lookups regardless of the number of routes.
+        """
+        self._excluded_model_set = frozenset(self.excluded_models)
+
+        # Required routes are unique by target
+        self._required_targets = dict(
+            (target, (source, field))
+            for (source, target), field in self._required_joins.items())
+
+    def _join_rejection(self, source, target, field=None):
+        """Returns a description of the rule that rejects the join between
+        `source` and `target` via `field` or None if the join is allowed.
+        """
         # No circles
         if target == source:
-            return False
+            return 'joins to the same model are not allowed'
 
         # Prevent join to excluded models
-        if target in self.excluded_models:
-            return False
+        if target in self._excluded_model_set:
+            return 'the model {0} is excluded'.format(self._label(target))
 
         # Never go back through the root
         if target == self.root_model:
-            return False
+            return 'joins back to the root model are not allowed'
 
         # Apply excluded joins if any
+        join = (source, target)
+
         if join in self._excluded_joins:
             _field = self._excluded_joins[join]
-            if not _field:
-                return False
-            elif _field and _field == field:
-                return False
+
+            if not _field or _field == field:
+                return 'the route {0} is excluded'.format(
+                    self._route_label(source, target, _field))
 
         # Check if the join is allowed by a required rule
-        for (_source, _target), _field in self._required_joins.items():
-            if _target == target:
-                if _source != source:
-                    return False
+        if target in self._required_targets:
+            _source, _field = self._required_targets[target]
 
-                # If a field is supplied, check to see if the field is allowed
-                # for this join.
-                if field and _field and _field != field:
-                    return False
+            # If a field is supplied, check to see if the field is allowed
+            # for this join.
+            if _source != source or (field and _field and _field != field):
+                return 'the route {0} is required'.format(
+                    self._route_label(_source, target, _field))
 
-        return True
+    def _join_allowed(self, source, target, field=None):
+        """Checks if the join between `source` and `target` via `field`
+        is allowed.
+        """
+        return self._join_rejection(source, target, field) is None
+
+    def _label(self, model):
+        return '{0}.{1}'.format(model._meta.app_label,
+                                model._meta.object_name)
+
+    def _route_label(self, source, target, field=None):
+        label = '{0} -> {1}'.format(self._label(source), self._label(target))
+
+        if field:
+            label += ' via {0}.{1}'.format(field.model._meta.object_name,
+                                           field.name)
+
+        return label
+
+    def explain_join(self, source, target, field=None):
+        """Returns a description of the rule that rejects the join between
+        the `source` and `target` models or None if the join is allowed. This
+        is intended for debugging route configurations.
+
+        The models may be classes or 'app.model' labels. `field` may be a
+        field or a 'model.field' label as used by routes.
+        """
+        source = self.get_model(source, local=False)
+        target = self.get_model(target, local=False)
+
+        if isinstance(field, six.string_types):
+            model_name, field_name = field.split('.', 1)
+
+            if model_name.lower() == source.__name__.lower():
+                field = self.get_field(field_name, source)
+            else:
+                field = self.get_field(field_name, target)
+
+        if isinstance(field, (ManyToOneRel, ManyToManyRel)):
+            field = field.field
+
+        return self._join_rejection(source, target, field)
 
     def _add_node(self, parent, model, relation, reverse, related_name,
                   accessor_name, nullable, depth):
         """Adds a node to the tree only if a node of the same `model' does not
-        already exist in the tree with smaller depth. If the node is added, the
-        tree traversal continues finding the node's relations.
+        already exist in the tree. Since candidates are added in order of the
+        length of their path, the first time a model is reached is always by
+        a shortest path. Returns the new node or None if it was not added.
 
         Conditions in which the node will fail to be added:
 
@@ -534,108 +734,173 @@ class ModelTree(object):
             - the model is going back the same path it came from
             - the model is circling back to the root_model
             - the model does not come from an explicitly declared parent model
+            - the model has already been reached by a path of equal or
+              shorter length
         """
         # Reverse relationships
         if reverse and '+' in related_name:
             return
 
-        node_hash = self._nodes.get(model, None)
-
-        # don't add node if a path with a shorter depth exists. this is applied
-        # after the correct join has been determined. generally if a route is
-        # defined for relation, this will never be an issue since there would
-        # only be one path available. if a route is not defined, the shorter
-        # path will be found
-        if not node_hash or node_hash['depth'] > depth:
-            if node_hash:
-                node_hash['parent'].remove_child(model)
+        # The first path to reach a model wins. Paths of equal length are
+        # resolved by their cost if there is a cost model, otherwise by the
+        # order in which the relations are traversed.
+        if model in self._nodes:
+            return
 
-            node = ModelTreeNode(model, parent, relation, reverse,
-                                 related_name, accessor_name, nullable, depth)
+        node = ModelTreeNode(model, parent, relation, reverse, related_name,
+                             accessor_name, nullable, depth)
 
-            self._nodes[model] = {
-                'parent': parent,
-                'depth': depth,
-                'node': node,
-            }
+        self._nodes[model] = node
 
-            node = self._find_relations(node, depth)
-            parent.children.append(node)
-
-    def _find_relations(self, node, depth=0):
-        """Finds all relations given a node."""
-        depth += 1
-
-        model = node.model
-
-        # NOTE: the many-to-many relations are evaluated first to prevent
-        # 'through' models being bound as a ForeignKey relationship.
-        fields = sorted(model._meta.get_fields(), reverse=True,
-                        key=lambda f: bool(f.many_to_many))
-
-        # determine relational fields to determine paths
-        forward_fields = [
-            f for f in fields
-            if (f.one_to_one or f.many_to_many or f.many_to_one)
-            and (f.concrete or not f.auto_created)
-            and f.rel is not None  # Generic foreign keys do not define rel.
-            and self._join_allowed(f.model, f.rel.to, f)
-        ]
-        reverse_fields = [
-            f for f in fields
-            if (f.one_to_many or f.one_to_one or f.many_to_many)
-            and (not f.concrete and f.auto_created)
-            and self._join_allowed(f.model, f.related_model, f.field)
-        ]
-
-        def get_relation_type(f):
-            if f.one_to_one:
-                return 'onetone'
-            elif f.many_to_many:
-                return 'manytomany'
-            elif f.one_to_many or f.many_to_one:
-                return 'foreignkey'
-
-        # Iterate over forward relations
-        for f in forward_fields:
-            null = f.many_to_many or f.null
-            kwargs = {
-                'parent': node,
-                'model': f.rel.to,
-                'relation': get_relation_type(f),
-                'reverse': False,
-                'related_name': f.name,
-                'accessor_name': f.name,
-                'nullable': null,
-                'depth': depth,
-            }
-            self._add_node(**kwargs)
-
-        # Iterate over reverse relations.
-        for r in reverse_fields:
-            kwargs = {
-                'parent': node,
-                'model': r.related_model,
-                'relation': get_relation_type(r),
-                'reverse': True,
-                'related_name': r.field.related_query_name(),
-                'accessor_name': r.get_accessor_name(),
-                'nullable': True,
-                'depth': depth,
-            }
-            self._add_node(**kwargs)
+        parent.children.append(node)
 
         return node
 
+    def _find_relations(self, node):
+        """Returns a list of keyword arguments for `_add_node` for each
+        allowed relation of a node along with the length of the relation,
+        one plus the cost of its route, and the cost of joining it from the
+        cost model.
+        """
+        depth = node.depth + 1
+        cost_model = self.cost_model
+
+        return [({
+            'parent': node,
+            'model': r.target,
+            'relation': r.relation,
+            'reverse': r.reverse,
+            'related_name': r.related_name,
+            'accessor_name': r.accessor_name,
+            'nullable': r.nullable,
+            'depth': depth,
+        }, 1 + self._route_cost(r.source, r.target, r.field),
+            cost_model.join_cost(r) if cost_model else 0)
+            for r in relations[node.model]
+            if self._join_allowed(r.source, r.target, r.field)]
+
+    def _reachable_relations(self):
+        """Returns the relations the traversal may follow, i.e. the allowed
+        relations of the models which are reachable from the root model.
+        """
+        reachable = []
+        seen = set([self.root_model])
+        queue = deque([self.root_model])
+
+        while queue:
+            for r in relations[queue.popleft()]:
+                if not self._join_allowed(r.source, r.target, r.field):
+                    continue
+
+                reachable.append(r)
+
+                # See `_add_node`
+                if r.reverse and '+' in r.related_name:
+                    continue
+
+                if r.target not in seen:
+                    seen.add(r.target)
+                    queue.append(r.target)
+
+        return reachable
+
+    def _add_root_node(self):
+        self._root_node = ModelTreeNode(self.root_model)
+        self._nodes[self.root_model] = self._root_node
+
+    def policy_key(self):
+        """Returns a key of the class and root model of the tree and of the
+        options which decide its paths, or None if the paths depend on
+        statistics. Trees with the same key have the same nodes, see
+        `modeltree.graph`. Subclasses may traverse the relations differently,
+        so their trees are not shared with those of other classes.
+        """
+        if self.cost_model is not None:
+            return
+
+        return (
+            self.__class__,
+            self.root_model,
+            self._excluded_model_set,
+            frozenset(self._required_joins.items()),
+            frozenset(self._excluded_joins.items()),
+            frozenset((join, frozenset(costs.items()))
+                      for join, costs in self._route_costs.items()),
+        )
+
+    def _traverse(self):
+        self._add_root_node()
+
+        # Candidate nodes are expanded in order of the length of the path,
+        # i.e. its depth plus the costs of its routes, then the cost of the
+        # path from the cost model, then the order in which they were found.
+        # Each model is added once by its first candidate, i.e. by its
+        # shortest path, and no subtree ever needs to be rebuilt. Without
+        # costs this is a breadth-first traversal.
+        heap = []
+        seq = itertools.count()
+
+        def expand(node, length, cost):
+            for kwargs, edge_length, join_cost in self._find_relations(node):
+                heapq.heappush(heap, (length + edge_length, cost + join_cost,
+                                      next(seq), kwargs))
+
+        expand(self._root_node, 0, 0)
+
+        while heap:
+            length, cost, _, kwargs = heapq.heappop(heap)
+
+            if kwargs['model'] in self._nodes:
+                continue
+
+            child = self._add_node(**kwargs)
+
+            if child is not None:
+                expand(child, length, cost)
+
     def _build(self):
-        node = ModelTreeNode(self.root_model)
-        self._root_node = self._find_relations(node)
+        key = self.policy_key()
 
-        self._nodes[self.root_model] = {
-            'parent': None,
-            'depth': 0,
-            'node': self._root_node,
-        }
+        if key is None:
+            self._build_state()
+            return
+
+        built = []
+
+        def build():
+            built.append(True)
+            return self._build_state()
+
+        # Trees with the same key share their nodes and indexes, which are
+        # not modified once built. The plan is kept by the graph and by its
+        # trees, see `modeltree.graph`.
+        self._plan = graph.plan(key, build)
+
+        (self._root_node, self._nodes, self._paths, self._query_strings,
+         self._fanout_tables, self._model_apps, self._models) = \
+            self._plan.state
+
+        # Other processes may still load the tree from a snapshot
+        if self.snapshot_dir and not built:
+            path = snapshots.snapshot_path(self.snapshot_dir, self)
+
+            if not os.path.exists(path):
+                self._save_snapshot(path)
+
+    def _build_state(self):
+        "Builds the nodes and indexes of the tree and returns them."
+        path = None
+
+        if self.snapshot_dir:
+            path = snapshots.snapshot_path(self.snapshot_dir, self)
+
+        if not (path and self.load_snapshot(path)):
+            self._traverse()
+
+            if path:
+                self._save_snapshot(path)
+
+        self._index_paths()
 
         # store local cache of all models in this tree by name
         for model in self._nodes:
@@ -645,6 +910,127 @@ class ModelTree(object):
             self._model_apps.appendlist(model_name, app_name)
             self._models[(app_name, model_name)] = model
 
+        return (self._root_node, self._nodes, self._paths,
+                self._query_strings, self._fanout_tables, self._model_apps,
+                self._models)
+
+    def _index_paths(self):
+        """Records the path of nodes from the root to each model and the
+        corresponding query string prefix. The join templates of each node
+        are compiled as well.
+        """
+        self._paths = {self.root_model: ()}
+        self._query_strings = {self.root_model: ''}
+        self._fanout_tables = set()
+
+        queue = deque([self._root_node])
+
+        while queue:
+            node = queue.popleft()
+            path = self._paths[node.model]
+            prefix = self._query_strings[node.model]
+
+            for child in node.children:
+                child._compile_joins()
+                self._paths[child.model] = path + (child,)
+
+                if child.fans_out:
+                    self._fanout_tables.update(
+                        args[0] for args in child._joins)
+
+                if prefix:
+                    self._query_strings[child.model] = str(
+                        prefix + '__' + child.related_name)
+                else:
+                    self._query_strings[child.model] = str(child.related_name)
+
+            queue.extend(node.children)
+
+    def _save_snapshot(self, path):
+        # A snapshot is only a cache of the tree, which is usable without it
+        try:
+            self.save_snapshot(path)
+        except (IOError, OSError) as e:
+            warnings.warn('Could not save the snapshot of the tree to '
+                          '"{0}": {1}'.format(path, e), RuntimeWarning)
+
+    def save_snapshot(self, path):
+        """Writes the nodes of the tree to `path` along with a fingerprint of
+        the schema and route configuration the tree was built from.
+        """
+        nodes = []
+        index = {}
+        queue = deque(self.root_node.children)
+
+        # Breadth-first so parents always precede their children
+        while queue:
+            node = queue.popleft()
+            index[node.model] = len(nodes)
+
+            nodes.append([
+                node.app_name,
+                node.model_name,
+                index.get(node.parent.model, -1),
+                node.relation,
+                node.reverse,
+                node.related_name,
+                node.accessor_name,
+                node.nullable,
+            ])
+
+            queue.extend(node.children)
+
+        snapshots.write(path, {
+            'version': snapshots.SNAPSHOT_VERSION,
+            'fingerprint': snapshots.fingerprint(self),
+            'nodes': nodes,
+        })
+
+    def load_snapshot(self, path):
+        """Replaces the nodes of the tree with the ones stored at `path`.
+        Returns False and leaves the tree untouched if the snapshot does not
+        exist, cannot be read or was built from a different schema or route
+        configuration.
+        """
+        data = snapshots.read(path)
+
+        if not data or data.get('fingerprint') != snapshots.fingerprint(self):
+            return False
+
+        _nodes = self._nodes
+        _root_node = getattr(self, '_root_node', None)
+
+        try:
+            self._nodes = {}
+            self._add_root_node()
+            added = []
+
+            for (app_name, model_name, parent, relation, reverse,
+                 related_name, accessor_name, nullable) in data['nodes']:
+
+                parent = added[parent] if parent >= 0 else self._root_node
+
+                node = self._add_node(
+                    parent, apps.get_model(app_name, model_name), relation,
+                    reverse, related_name, accessor_name, nullable,
+                    parent.depth + 1)
+
+                if node is None:
+                    raise ValueError('Duplicate node in snapshot')
+
+                added.append(node)
+        except (KeyError, IndexError, LookupError, TypeError, ValueError):
+            self._nodes = _nodes
+
+            if _root_node is None:
+                del self._root_node
+            else:
+                self._root_node = _root_node
+
+            return False
+
+        return True
+
     @property
     def root_node(self):
         "Returns the `root_node` and implicitly builds the tree."
@@ -652,21 +1038,10 @@ class ModelTree(object):
             self._build()
         return self._root_node
 
-    def _node_path_to_model(self, model, node, path=[]):
-        "Returns a list representing the path of nodes to the model."
-        if node.model == model:
-            return path
-
-        for child in node.children:
-            mpath = self._node_path_to_model(model, child, path + [child])
-            # TODO why is this condition here?
-            if mpath:
-                return mpath
-
     def _node_path(self, model):
         "Returns a list of nodes thats defines the path of traversal."
         model = self.get_model(model)
-        return self._node_path_to_model(model, self.root_node)
+        return list(self._paths[model])
 
     def get_joins(self, model):
         """Returns a list of JOIN connections that can be manually applied to a
@@ -689,8 +1064,7 @@ class ModelTree(object):
         return joins
 
     def query_string(self, model):
-        nodes = self._node_path(model)
-        return str('__'.join(n.related_name for n in nodes))
+        return self._query_strings[self.get_model(model)]
 
     def query_string_for_field(self, field, operator=None, model=None):
         """Takes a `models.Field` instance and returns a query string relative
@@ -726,6 +1100,50 @@ class ModelTree(object):
                                              model=model)
         return Q(**{lookup: value})
 
+    def path_fans_out(self, model):
+        """Returns true if joining the path to `model` may duplicate rows of
+        the root model.
+        """
+        path = self._paths[self.get_model(model)]
+        return any(node.fans_out for node in path)
+
+    def query_fans_out(self, query):
+        """Returns true if `query` joins a table of a node which may duplicate
+        rows of the root model.
+        """
+        return any(query.alias_refcount[alias] and
+                   table.table_name in self._fanout_tables
+                   for alias, table in query.alias_map.items())
+
+    def _join_path(self, query, model, joined):
+        """Joins the nodes on the path to `model` that are not in `joined`
+        yet. `joined` maps models to the alias of their table and is updated
+        in place so paths sharing a prefix are only joined once. Returns the
+        alias to the model's database table.
+        """
+        if model in joined:
+            return joined[model]
+
+        # Ensures the root table is setup
+        if self.root_model not in joined:
+            joined[self.root_model] = query.get_initial_alias()
+
+        alias = joined[self.root_model]
+
+        for node in self._paths[model]:
+            if node.model in joined:
+                alias = joined[node.model]
+                continue
+
+            for join in node.get_joins()[1]:
+                alias = query.join(join)
+
+            joined[node.model] = alias
+
+        joined[model] = alias
+
+        return alias
+
     def add_joins(self, model, queryset=None):
         """Sets up all necessary joins up to the given model on the queryset.
         Returns the alias to the model's database table.
@@ -735,53 +1153,88 @@ class ModelTree(object):
         else:
             clone = queryset._clone()
 
-        alias = None
-
-        for i, join in enumerate(self.get_joins(model)):
-            if isinstance(join, BaseTable):
-                alias_map = clone.query.alias_map
-                if join.table_alias in alias_map or \
-                        join.table_name in alias_map:
-                    continue
-            alias = clone.query.join(join)
-
-        # this implies the join is redundant and occurring on the root model's
-        # table
-        if alias is None:
-            alias = clone.query.get_initial_alias()
+        alias = self._join_path(clone.query, self.get_model(model), {})
 
         return clone, alias
 
     def add_select(self, *fields, **kwargs):
-        "Replaces the `SELECT` columns with the ones provided."
+        """Replaces the `SELECT` columns with the ones provided. The joins
+        for all fields are planned together so each join is added once on a
+        single clone of the queryset.
+        """
         if 'queryset' in kwargs:
-            queryset = kwargs.pop('queryset')
+            queryset = kwargs.pop('queryset')._clone()
         else:
             queryset = self.get_queryset()
 
-        queryset.query.default_cols = False
+        query = queryset.query
+        query.default_cols = False
         include_pk = kwargs.pop('include_pk', True)
 
         if include_pk:
             fields = [self.root_model._meta.pk] + list(fields)
 
-        aliases = []
+        joined = {}
+        aliases = [self._field_col(query, pair, joined) for pair in fields]
 
-        for pair in fields:
-            if isinstance(pair, (list, tuple)):
-                model, field = pair
-            else:
-                field = pair
-                model = field.model
+        if aliases:
+            query.select = aliases
+
+        return queryset
+
+    def _field_col(self, query, pair, joined):
+        """Joins the path to the model of a field, or a (model, field)
+        pair, and returns the column of the field.
+        """
+        if isinstance(pair, (list, tuple)):
+            model, field = pair
+        else:
+            field = pair
+            model = field.model
 
-            queryset, alias = self.add_joins(model, queryset)
+        if model not in joined:
+            joined[model] = self._join_path(
+                query, self.get_model(model), joined)
 
-            aliases.append(Col(alias, field, field))
+        return Col(joined[model], field, field)
 
-        if aliases:
-            queryset.query.select = aliases
+    def correlated_aggregate(self, function, field, outer_query):
+        """Returns an expression of a subquery which computes the aggregate
+        `function`, e.g. `Sum`, of a field over the rows related to the
+        current root row of `outer_query`. The field can be given as a
+        (model, field) pair like for `add_select`.
+        """
+        inner = self.get_queryset().query
+        inner.default_cols = False
 
-        return queryset
+        aggregate = function(self._field_col(inner, field, {}))
+        inner.add_annotation(aggregate, 'value')
+
+        return subqueries.CorrelatedAggregate(
+            inner, outer_query.get_initial_alias(),
+            output_field=aggregate.output_field)
+
+    def add_exists(self, query, condition, negated=False):
+        """Adds `condition`, a `Q` object, to `query` as an `EXISTS`
+        subquery over the root model if the condition joins a node which
+        fans out. This avoids joins which duplicate root rows. Returns false
+        if the condition does not fan out and is not added.
+        """
+        inner = self.get_queryset().query
+        inner.add_q(condition)
+
+        if not self.query_fans_out(inner):
+            return False
+
+        inner.clear_select_clause()
+        inner.clear_ordering(True)
+        inner.add_extra({'a': 1}, None, None, None, None, None)
+        inner.set_extra_mask(['a'])
+
+        query.where.add(subqueries.Exists(
+            inner, query.get_initial_alias(), negated), AND)
+
+        return True
 
     def get_queryset(self):
         "Returns a QuerySet relative to the `root_model`."
@@ -789,12 +1242,38 @@ class ModelTree(object):
 
 
 class LazyModelTrees(object):
-    "Lazily evaluates `ModelTree` instances defined in settings."
-    def __init__(self, modeltrees):
+    """Lazily evaluates `ModelTree` instances defined in settings.
+
+    If `snapshot_dir` is set, trees are loaded from snapshots in that
+    directory when they are still valid and saved there once built.
+
+    Trees can be requested from several threads. Each tree is built once:
+    threads requesting a tree which is being built wait for it.
+
+    If `max_trees` is set, at most that many trees whose aliases are not
+    defined in settings, e.g. trees rooted at arbitrary models, are kept.
+    The least recently used one is evicted when another is created. Trees
+    defined in settings are always kept.
+    """
+    def __init__(self, modeltrees, snapshot_dir=None, max_trees=None):
         self.modeltrees = modeltrees
+        self.snapshot_dir = snapshot_dir
+        self.max_trees = max_trees
         self._modeltrees = {}
         self._model_aliases = {}
 
+        # A lock per alias, so each tree is built by a single thread while
+        # other threads requesting it wait for the result
+        self._locks = {}
+        self._lock = threading.Lock()
+
+        # Aliases of the trees not defined in settings by recency of use
+        # and the counters of their use
+        self._dynamic = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
     def __getitem__(self, alias):
         return self._get_or_create(alias)
 
@@ -840,9 +1319,18 @@ class LazyModelTrees(object):
                                             self._get_model_label(model))
             kwargs = {'model': model}
 
-        # Check if the modeltree is defined after parsing the alias
-        if alias in self._modeltrees:
-            return self._modeltrees[alias]
+        # Check if the modeltree is defined after parsing the alias. Trees
+        # which are built are read without locking.
+        tree = self._modeltrees.get(alias)
+        if tree is not None:
+            if alias not in self.modeltrees:
+                if self.max_trees is None:
+                    # No tree is evicted, so the recency of use is not
+                    # recorded. The counter may miss concurrent hits.
+                    self.hits += 1
+                else:
+                    self._used(alias, hit=True)
+            return tree
 
         # Override kwargs if settings exists for this alias. If nothing
         # exists, raise an error.
@@ -851,13 +1339,96 @@ class LazyModelTrees(object):
             raise ImproperlyConfigured('No modeltree settings defined '
                                        'for "{0}"'.format(alias))
 
-        return self._create(alias, **kwargs)
+        with self._alias_lock(alias):
+            # The tree may have been built while waiting for the lock
+            tree = self._modeltrees.get(alias)
+            if tree is None:
+                tree = self._build_tree(alias, **kwargs)
+
+                if alias not in self.modeltrees:
+                    self._used(alias, hit=False)
+
+        return tree
+
+    def _used(self, alias, hit=None):
+        """Records the use of the tree of `alias` which is not in settings.
+        `hit` is whether the tree was found or built when it was requested
+        and is None if it was created explicitly.
+        """
+        evicted = []
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            elif hit is not None:
+                self.misses += 1
+
+            # The tree may have been evicted since it was found
+            if alias not in self._modeltrees:
+                return
+
+            self._dynamic.pop(alias, None)
+            self._dynamic[alias] = None
+
+            while self.max_trees is not None and \
+                    len(self._dynamic) > self.max_trees:
+                evicted.append(self._evict(self._dynamic.popitem(False)[0]))
+
+        # Lookups resolved by an evicted tree are no longer needed
+        for tree in evicted:
+            tree.lookup_cache.clear()
+            tree.templates.clear()
+
+    def _evict(self, alias):
+        tree = self._modeltrees.pop(alias)
+        self._locks.pop(alias, None)
+
+        if self._model_aliases.get(tree.root_model) == alias:
+            del self._model_aliases[tree.root_model]
+
+        self.evictions += 1
+        return tree
+
+    def stats(self):
+        "Returns a dict of the counters of the trees not in settings."
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._dynamic),
+            'maxsize': self.max_trees,
+        }
+
+    def _alias_lock(self, alias):
+        "Returns the lock held while the tree of `alias` is built."
+        with self._lock:
+            return self._locks.setdefault(alias, threading.Lock())
 
     def _create(self, alias, **kwargs):
+        with self._alias_lock(alias):
+            tree = self._build_tree(alias, **kwargs)
+
+        if alias not in self.modeltrees:
+            self._used(alias)
+
+        return tree
+
+    def _build_tree(self, alias, **kwargs):
+        kwargs.setdefault('snapshot_dir', self.snapshot_dir)
         tree = ModelTree(alias=alias, **kwargs)
-        self._modeltrees[alias] = tree
+        replaced = self._modeltrees.get(alias)
+
+        # The alias of the model is published before the tree, so a tree
+        # which is found is fully registered.
         self._model_aliases[tree.root_model] = alias
-        return self._modeltrees[alias]
+        self._modeltrees[alias] = tree
+
+        # Lookups resolved by a replaced tree may no longer be valid
+        if replaced is not None:
+            replaced.lookup_cache.clear()
+            replaced.templates.clear()
+
+        return tree
 
     def create(self, alias, model=None, **kwargs):
         if inspect.isclass(alias) and issubclass(alias, models.Model):
@@ -866,9 +1437,55 @@ class LazyModelTrees(object):
         kwargs['model'] = model
         return self._create(alias, **kwargs)
 
+    def warm(self, aliases=None, workers=None):
+        """Builds the trees of `aliases` or of all aliases defined in
+        settings, so they are not built on first use. If `workers` is
+        greater than one, the trees are built in parallel on a thread pool
+        of that size, which helps when building waits on the database, e.g.
+        for statistics, or on snapshots.
+
+        Returns a dict of the build time in seconds and the number of nodes
+        of each tree by alias. Trees which are already built are not built
+        again and take no time.
+        """
+        if aliases is None:
+            aliases = sorted(self.modeltrees)
+
+        if workers and workers > 1:
+            if ThreadPoolExecutor is None:
+                raise ImproperlyConfigured('The futures package must be '
+                                           'installed to warm trees in '
+                                           'parallel')
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                built = list(pool.map(self._warm_in_thread, aliases))
+        else:
+            built = [self._warm(alias) for alias in aliases]
+
+        return dict(zip(aliases, built))
+
+    def _warm(self, alias):
+        start = time.time()
+        tree = self[alias]
+
+        return {
+            'time': time.time() - start,
+            'nodes': len(tree._nodes),
+        }
+
+    def _warm_in_thread(self, alias):
+        try:
+            return self._warm(alias)
+        finally:
+            # Connections of the pool's threads would otherwise be leaked
+            for connection in connections.all():
+                connection.close()
+
     @property
     def default(self):
         return self._get_or_create()
 
 
-trees = LazyModelTrees(getattr(settings, 'MODELTREES', {}))
+trees = LazyModelTrees(getattr(settings, 'MODELTREES', {}),
+                       getattr(settings, 'MODELTREE_SNAPSHOT_DIR', None),
+                       getattr(settings, 'MODELTREE_MAX_TREES', None))
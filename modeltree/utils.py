@@ -88,12 +88,53 @@ def resolve_lookup(path, tree=None):
     if num_toks > 4:
         return path
 
-    # Starting tokens for full qualified path.
-    app_name = model_name = field_name = operator = None
-
     # Get the `ModelTree` instance these lookups are relative to
     mtree = trees[tree]
 
+    if mtree._lookups is None and mtree.precompile_lookups:
+        _compile_lookups(mtree)
+
+    # A single probe of the compiled lookups if available
+    if mtree._lookups is not None:
+        operator = None
+
+        if num_toks > 1 and toks[-1] in QUERY_TERMS:
+            operator = toks[-1]
+            key = path[:-len(operator) - len(LOOKUP_SEP)]
+        else:
+            key = path
+
+        entry = mtree._lookups.get(key)
+
+        if entry is not None:
+            lookup, takes_operator = entry
+
+            if isinstance(lookup, Exception):
+                raise lookup.__class__(*lookup.args)
+
+            if operator and takes_operator:
+                return lookup + LOOKUP_SEP + operator
+
+            return lookup
+
+    lookup = mtree.lookup_cache.get(path)
+
+    if lookup is None:
+        lookup = _resolve_lookup(toks, mtree) or path
+        mtree.lookup_cache.set(path, lookup)
+
+    return lookup
+
+
+def _resolve_lookup(toks, mtree):
+    """Resolves the tokens of a path. Returns None if the path cannot be
+    resolved and should be used as is.
+    """
+    num_toks = len(toks)
+
+    # Starting tokens for full qualified path.
+    app_name = model_name = field_name = operator = None
+
     # Check for a field lookup operator. If it is supplied, a `field_name` must
     # also be specified.
     if num_toks > 1 and toks[-1] in QUERY_TERMS:
@@ -116,9 +157,9 @@ def resolve_lookup(path, tree=None):
                 model_name = toks[0]
             except ModelNotRelated:
                 raise InvalidLookup('No field or related model corresponds '
-                                    'to "{0}".'.format(model_name))
+                                    'to "{0}".'.format(toks[0]))
             except ModelNotUnique as e:
-                raise InvalidLookup(e.message)
+                raise InvalidLookup(str(e))
 
     # Two tokens may be a (model, field) pair or (app, model) pair. The
     # latter implies the primary key field of the found model. If neither
@@ -147,7 +188,76 @@ def resolve_lookup(path, tree=None):
             pass
 
     # Fallback to returning the path as is for cross-relation lookups
-    return path
+    return None
+
+
+def _lookup_candidates(mtree):
+    "Returns the token tuples of all possible short-form lookups."
+    def field_names(model):
+        names = set()
+
+        for f in model._meta.get_fields():
+            names.add(f.name)
+
+            if getattr(f, 'attname', None):
+                names.add(f.attname)
+
+        return names
+
+    candidates = set((name,) for name in field_names(mtree.root_model))
+
+    for (app_name, model_name), model in mtree._models.items():
+        candidates.add((model_name,))
+        candidates.add((app_name, model_name))
+
+        for field_name in field_names(model):
+            candidates.add((model_name, field_name))
+            candidates.add((app_name, model_name, field_name))
+
+    return candidates
+
+
+def _compile_lookups(mtree):
+    """Resolves every short-form lookup of the tree up front. Each entry maps
+    the path without an operator to the resolved lookup and whether an
+    operator is appended to it (operators are dropped for model lookups),
+    or to the exception the lookup raises, e.g. for ambiguous model names.
+    Paths that would be used as is are not included.
+    """
+    lookups = {}
+
+    for toks in _lookup_candidates(mtree):
+        path = LOOKUP_SEP.join(toks)
+
+        try:
+            lookup = _resolve_lookup(list(toks), mtree)
+
+            if lookup is None:
+                continue
+
+            with_operator = _resolve_lookup(list(toks) + ['exact'], mtree)
+            takes_operator = with_operator != lookup
+        except Exception as e:
+            lookup, takes_operator = e, False
+
+        lookups[path] = (lookup, takes_operator)
+
+    mtree._lookups = lookups
+
+    return lookups
+
+
+def compile_lookups(tree=None):
+    """Compiles all short-form lookups of a tree, i.e. `field`, `model`,
+    `app__model`, `model__field` and `app__model__field`, so they are
+    resolved with a single probe by `resolve_lookup`. Returns a dict of each
+    valid lookup path and the lookup string it resolves to.
+    """
+    mtree = trees[tree]
+    lookups = _compile_lookups(mtree)
+
+    return dict((path, lookup) for path, (lookup, _) in lookups.items()
+                if not isinstance(lookup, Exception))
 
 
 class M(models.Q):
@@ -2,3 +2,15 @@ from .test_utils import *  # noqa
 from .test_query import *  # noqa
 from .test_tree import *  # noqa
 from .test_routes import *  # noqa
+from .test_build import *  # noqa
+from .test_relations import *  # noqa
+from .test_snapshots import *  # noqa
+from .test_cache import *  # noqa
+from .test_async import *  # noqa
+from .test_partitions import *  # noqa
+from .test_aggregates import *  # noqa
+from .test_semijoin import *  # noqa
+from .test_costs import *  # noqa
+from .test_results import *  # noqa
+from .test_templates import *  # noqa
+from .test_graph import *  # noqa
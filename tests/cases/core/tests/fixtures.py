@@ -0,0 +1,19 @@
+from tests import models
+
+
+class EmployeesMixin(object):
+    "Creates `size` employees with the same title and office."
+    size = 25
+
+    def setUp(self):
+        super(EmployeesMixin, self).setUp()
+
+        self.title = models.Title.objects.create(name='Engineer', salary=10)
+        self.office = models.Office.objects.create(location='Outer Space')
+
+        models.Employee.objects.bulk_create([
+            models.Employee(first_name='First {0}'.format(i),
+                            last_name='Last', title=self.title,
+                            office=self.office)
+            for i in range(self.size)
+        ])
@@ -0,0 +1,90 @@
+from django.db.models import Count, Sum
+from django.test import TestCase
+from modeltree.tree import trees
+from tests import models
+
+__all__ = ('FanOutTestCase',)
+
+
+class FanOutTestCase(TestCase):
+    def setUp(self):
+        office = models.Office.objects.create(location='Outer Space')
+        junior = models.Title.objects.create(name='Junior', salary=10)
+        senior = models.Title.objects.create(name='Senior', salary=20)
+
+        self.e1, self.e2, self.e3 = [
+            models.Employee.objects.create(first_name=name, last_name='Last',
+                                           title=title, office=office)
+            for name, title in [('One', senior), ('Two', junior),
+                                ('Three', junior)]
+        ]
+
+        p1 = models.Project.objects.create(name='P1', manager=self.e1,
+                                           due_date='2020-01-01')
+        p2 = models.Project.objects.create(name='P2', manager=self.e1,
+                                           due_date='2020-01-01')
+        p1.employees.add(self.e1, self.e2)
+        p2.employees.add(self.e1)
+
+        m1 = models.Meeting.objects.create(
+            office=office, start_time='2020-01-01 10:00',
+            end_time='2020-01-01 11:00')
+        m2 = models.Meeting.objects.create(
+            office=office, start_time='2020-01-02 10:00',
+            end_time='2020-01-02 11:00')
+        m1.attendees.add(self.e1, self.e2, self.e3)
+        m2.attendees.add(self.e1)
+
+        self.salary = models.Title._meta.get_field('salary')
+        self.project = models.Project._meta.get_field('id')
+        self.meeting = models.Meeting._meta.get_field('id')
+
+    def test_fans_out(self):
+        tree = trees['default']
+
+        self.assertTrue(tree.path_fans_out(models.Project))
+        self.assertTrue(tree.path_fans_out(models.Meeting))
+        self.assertFalse(tree.path_fans_out(models.Title))
+
+        self.assertTrue(tree.query_fans_out(
+            models.Employee.branches.select(self.project).query))
+        self.assertFalse(tree.query_fans_out(
+            models.Employee.branches.select(self.salary).query))
+
+    def test_count(self):
+        qs = models.Employee.branches.filter(project__name__in=['P1', 'P2'])
+
+        self.assertEqual(qs.count(), 3)
+        self.assertEqual(qs.tree_count(), 2)
+
+        qs = models.Employee.branches.filter(title__salary=10)
+        self.assertEqual(qs.tree_count(), 2)
+
+    def test_aggregate(self):
+        qs = models.Employee.branches.filter(project__name__in=['P1', 'P2'])
+
+        self.assertEqual(qs.tree_aggregate(
+            salary=(Sum, self.salary),
+            meetings=(Count, self.meeting),
+            projects=(Count, self.project),
+        ), {'salary': 30, 'meetings': 3, 'projects': 3})
+
+    def test_annotate(self):
+        qs = models.Employee.branches.select(self.salary).order_by('id')\
+            .tree_annotate(projects=(Count, self.project),
+                           meetings=(Count, self.meeting))
+
+        self.assertEqual(list(qs.raw()), [
+            (self.e1.pk, 20, 2, 2),
+            (self.e2.pk, 10, 1, 1),
+            (self.e3.pk, 10, 1, 0),
+        ])
+
+    def test_annotate_subquery(self):
+        qs = models.Employee.branches.filter(project__name='P1')\
+            .tree_annotate(salary=(Sum, self.salary))
+
+        # The subquery follows the aliases of the outer query
+        self.assertEqual(sorted(models.Title.objects.filter(
+            salary__in=qs.values('salary')).values_list('name', flat=True)),
+            ['Junior', 'Senior'])
@@ -0,0 +1,97 @@
+from unittest import skipIf
+
+from django.test import TransactionTestCase, override_settings
+from modeltree import aio, executor
+from tests import models
+from .fixtures import EmployeesMixin
+
+__all__ = ('AsyncQueryTestCase',)
+
+
+@skipIf(aio.asyncio is None or executor.ThreadPoolExecutor is None,
+        'asyncio and concurrent.futures are required')
+class AsyncQueryTestCase(EmployeesMixin, TransactionTestCase):
+    available_apps = ['tests']
+    size = 250
+
+    def setUp(self):
+        super(AsyncQueryTestCase, self).setUp()
+
+        self.loop = aio.asyncio.new_event_loop()
+        aio.asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        aio.asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_loop(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def consume(self, rows):
+        "Drives the asynchronous iterator as `async for` would."
+        values = []
+
+        while True:
+            try:
+                values.append(self.run_loop(rows.__anext__()))
+            except StopAsyncIteration:  # noqa
+                return values
+
+    def test_count(self):
+        qs = models.Employee.branches.filter(title__salary=10)
+        self.assertEqual(self.run_loop(qs.acount()), self.size)
+
+    def test_concurrent(self):
+        qs = models.Employee.branches.filter(title__salary=10)
+
+        counts = self.run_loop(aio.asyncio.gather(
+            *[qs.acount() for i in range(10)]))
+
+        self.assertEqual(counts, [self.size] * 10)
+
+    def test_select(self):
+        salary = models.Title._meta.get_field('salary')
+        qs = models.Employee.branches.order_by('id')
+
+        rows = self.run_loop(qs.aselect(salary))
+
+        self.assertEqual(rows, list(qs.select(salary).raw()))
+
+    def test_raw(self):
+        salary = models.Title._meta.get_field('salary')
+        qs = models.Employee.branches.select(salary).order_by('id')
+
+        rows = self.consume(qs.araw(chunk_size=30))
+
+        self.assertEqual(rows, list(qs.raw()))
+
+    def test_close(self):
+        qs = models.Employee.branches.order_by('id')
+        rows = qs.araw(chunk_size=30)
+
+        self.run_loop(rows.__anext__())
+        self.run_loop(rows.aclose())
+
+        self.assertEqual(self.consume(rows), [])
+
+    @override_settings(MODELTREE_WORKERS=1)
+    def test_query_while_iterating(self):
+        # A pool of a single worker
+        executor.shutdown()
+
+        try:
+            qs = models.Employee.branches.order_by('id')
+            rows = qs.araw(chunk_size=30)
+            counts = []
+
+            for i in range(3):
+                self.run_loop(rows.__anext__())
+
+                # Open iterators do not hold the workers of the pool
+                counts.append(self.run_loop(aio.asyncio.wait_for(
+                    qs.acount(), 10, loop=self.loop)))
+
+            self.run_loop(rows.aclose())
+            self.assertEqual(counts, [self.size] * 3)
+        finally:
+            executor.shutdown()
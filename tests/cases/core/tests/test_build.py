@@ -0,0 +1,134 @@
+from django.apps import apps
+from django.test import TestCase
+from modeltree.tree import ModelTree, ModelTreeNode
+
+__all__ = ('LegacyModelTree', 'BuildEquivalenceTestCase')
+
+
+class LegacyModelTree(ModelTree):
+    """The original depth-first builder which re-expands a model's subtree
+    whenever a shorter path to it is found. Kept as a reference for
+    equivalence tests and benchmarks.
+    """
+    def _legacy_add_node(self, parent, model, relation, reverse,
+                         related_name, accessor_name, nullable, depth):
+        if reverse and '+' in related_name:
+            return
+
+        existing = self._nodes.get(model, None)
+
+        if not existing or existing.depth > depth:
+            if existing:
+                existing.parent.remove_child(model)
+
+            node = ModelTreeNode(model, parent, relation, reverse,
+                                 related_name, accessor_name, nullable, depth)
+
+            self._nodes[model] = node
+
+            node = self._legacy_find_relations(node, depth)
+            parent.children.append(node)
+
+    def _legacy_find_relations(self, node, depth=0):
+        depth += 1
+
+        fields = sorted(node.model._meta.get_fields(), reverse=True,
+                        key=lambda f: bool(f.many_to_many))
+
+        forward_fields = [
+            f for f in fields
+            if (f.one_to_one or f.many_to_many or f.many_to_one)
+            and (f.concrete or not f.auto_created)
+            and f.rel is not None
+            and self._join_allowed(f.model, f.rel.to, f)
+        ]
+        reverse_fields = [
+            f for f in fields
+            if (f.one_to_many or f.one_to_one or f.many_to_many)
+            and (not f.concrete and f.auto_created)
+            and self._join_allowed(f.model, f.related_model, f.field)
+        ]
+
+        def get_relation_type(f):
+            if f.one_to_one:
+                return 'onetone'
+            elif f.many_to_many:
+                return 'manytomany'
+            elif f.one_to_many or f.many_to_one:
+                return 'foreignkey'
+
+        for f in forward_fields:
+            self._legacy_add_node(node, f.rel.to, get_relation_type(f), False,
+                                  f.name, f.name, f.many_to_many or f.null,
+                                  depth)
+
+        for r in reverse_fields:
+            self._legacy_add_node(node, r.related_model,
+                                  get_relation_type(r), True,
+                                  r.field.related_query_name(),
+                                  r.get_accessor_name(), True, depth)
+
+        return node
+
+    def _traverse(self):
+        node = ModelTreeNode(self.root_model)
+        self._root_node = self._legacy_find_relations(node)
+        self._nodes[self.root_model] = self._root_node
+
+    def _node_path_to_model(self, model, node, path=()):
+        "Returns the path of nodes to the model by searching the tree."
+        if node.model == model:
+            return list(path)
+
+        for child in node.children:
+            mpath = self._node_path_to_model(model, child, path + (child,))
+
+            if mpath:
+                return mpath
+
+
+def flatten(node):
+    "Returns a nested, comparable representation of the tree."
+    return (node.model, node.relation, node.reverse, node.related_name,
+            node.accessor_name, node.nullable, node.depth,
+            [flatten(child) for child in node.children])
+
+
+class BuildEquivalenceTestCase(TestCase):
+    configs = [
+        {},
+        {'required_routes': [{'source': 'tests.C', 'target': 'tests.D'}]},
+        {'required_routes': [{'source': 'tests.H', 'target': 'tests.G'}]},
+        {'excluded_routes': [{'source': 'tests.B', 'target': 'tests.D'},
+                             {'source': 'tests.F', 'target': 'tests.D'}]},
+        {'required_routes': [{'source': 'tests.H', 'target': 'tests.G'}],
+         'excluded_routes': [{'source': 'tests.B', 'target': 'tests.D'},
+                             {'source': 'tests.D', 'target': 'tests.F'}]},
+        {'required_routes': [{'source': 'tests.D', 'target': 'tests.E',
+                              'field': 'D.e1_set'}]},
+        {'excluded_models': ['tests.Title', 'tests.D']},
+    ]
+
+    def assertEquivalent(self, model, **kwargs):
+        tree = ModelTree(model, **kwargs)
+        legacy = LegacyModelTree(model, **kwargs)
+
+        self.assertEqual(flatten(tree.root_node), flatten(legacy.root_node))
+        self.assertEqual(set(tree._nodes), set(legacy._nodes))
+
+        # Memoized paths match a search of the legacy tree
+        for model in tree._nodes:
+            path = legacy._node_path_to_model(model, legacy.root_node)
+
+            self.assertEqual(
+                [(n.model, n.related_name) for n in tree._node_path(model)],
+                [(n.model, n.related_name) for n in path])
+
+    def test_all_roots(self):
+        for model in apps.get_models():
+            self.assertEquivalent(model)
+
+    def test_routes(self):
+        for kwargs in self.configs:
+            for model in apps.get_app_config('tests').get_models():
+                self.assertEquivalent(model, **kwargs)
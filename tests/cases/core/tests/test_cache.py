@@ -0,0 +1,102 @@
+import pickle
+import threading
+
+from django.test import TestCase
+from modeltree.cache import LRUCache
+from modeltree.tree import trees
+from modeltree.utils import resolve_lookup
+from tests.models import Employee, Office
+
+__all__ = ('LRUCacheTestCase', 'LookupCacheTestCase')
+
+
+class LRUCacheTestCase(TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        # Touch 'a' so 'b' is the least recently used
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b'), None)
+
+        self.assertEqual(cache.stats(), {
+            'hits': 1,
+            'misses': 1,
+            'evictions': 1,
+            'size': 2,
+            'maxsize': 2,
+        })
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_pickle(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+
+        # Entries are not pickled
+        loaded = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(loaded), 0)
+        self.assertEqual(loaded.maxsize, 2)
+
+        loaded.set('b', 2)
+        self.assertEqual(loaded.get('b'), 2)
+
+    def test_threads(self):
+        cache = LRUCache(50)
+
+        def work(n):
+            for i in range(500):
+                cache.set((n, i % 80), i)
+                cache.get((n, (i + 1) % 80))
+
+        threads = [threading.Thread(target=work, args=(n,))
+                   for n in range(8)]
+
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = cache.stats()
+        self.assertEqual(stats['size'], 50)
+        self.assertEqual(stats['hits'] + stats['misses'], 8 * 500)
+
+
+class LookupCacheTestCase(TestCase):
+    def test_memo(self):
+        tree = trees.create(Office)
+        self.assertEqual(len(tree.lookup_cache), 0)
+
+        self.assertEqual(resolve_lookup('title__salary', tree=Office),
+                         'employee__title__salary')
+        self.assertEqual(resolve_lookup('title__salary', tree=Office),
+                         'employee__title__salary')
+
+        stats = tree.lookup_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+        # Recreating the tree starts with an empty memo
+        new_tree = trees.create(Office)
+        self.assertEqual(len(tree.lookup_cache), 0)
+        self.assertEqual(len(new_tree.lookup_cache), 0)
+
+        self.assertEqual(resolve_lookup('title__salary', tree=Office),
+                         'employee__title__salary')
+        self.assertEqual(new_tree.lookup_cache.stats()['misses'], 1)
+
+    def test_unresolved(self):
+        tree = trees.create(Employee)
+
+        # Paths used as is are memoized as well
+        self.assertEqual(resolve_lookup('manager__last_name', tree=Employee),
+                         'manager__last_name')
+        self.assertEqual(tree.lookup_cache.get('manager__last_name'),
+                         'manager__last_name')
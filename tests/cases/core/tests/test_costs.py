@@ -0,0 +1,160 @@
+import pickle
+
+from django.test import TestCase
+from modeltree import snapshots
+from modeltree.costs import CostModel, DatabaseStatistics, \
+    StaticStatistics, database_statistics
+from modeltree.relations import relations
+from modeltree.tree import ModelTree
+from tests import models
+
+__all__ = ('CostModelTestCase', 'StatisticsPathTestCase',
+           'DatabaseStatisticsTestCase')
+
+
+def path(tree, model):
+    return [node.model for node in tree._node_path(model)]
+
+
+def relation(source, accessor_name):
+    for r in relations[source]:
+        if r.accessor_name == accessor_name:
+            return r
+
+
+class RecordedStatistics(StaticStatistics):
+    "Records the tables whose statistics are read."
+    def __init__(self, *args, **kwargs):
+        super(RecordedStatistics, self).__init__(*args, **kwargs)
+        self.tables = set()
+
+    def row_count(self, table):
+        self.tables.add(table)
+        return super(RecordedStatistics, self).row_count(table)
+
+
+class CostModelTestCase(TestCase):
+    def test_indexes(self):
+        stats = StaticStatistics(rows={'tests_d': 1000},
+                                 indexes={'tests_d': ['id']})
+        cost_model = CostModel(stats)
+
+        # Reverse foreign key on an unindexed column is a scan
+        self.assertEqual(cost_model.join_cost(relation(models.B, 'd_set')),
+                         2 ** 9 * 1.5)
+
+        # Forward foreign key to the primary key
+        self.assertEqual(cost_model.join_cost(relation(models.D, 'b')), 1)
+
+    def test_many_to_many(self):
+        cost_model = CostModel(StaticStatistics(rows={'tests_e_d': 7}))
+        steps = cost_model.join_steps(relation(models.D, 'e_set'))
+
+        self.assertEqual(steps, [('tests_e_d', 'd_id'), ('tests_e', 'id')])
+        self.assertEqual(cost_model.join_cost(relation(models.D, 'e_set')),
+                         (4 + 1) * 1.5)
+
+    def test_outer_joins(self):
+        cost_model = CostModel(StaticStatistics())
+
+        # Reverse one-to-one is nullable, the forward foreign key is not
+        self.assertEqual(cost_model.join_cost(relation(models.D, 'f')), 1.5)
+        self.assertEqual(cost_model.join_cost(relation(models.D, 'c')), 1)
+
+
+class StatisticsPathTestCase(TestCase):
+    large = StaticStatistics(rows={'tests_b': 10 ** 6},
+                             indexes={'tests_b': ['id']})
+
+    def test_default(self):
+        tree = ModelTree(models.A)
+        self.assertEqual(path(tree, models.D), [models.B, models.D])
+
+    def test_cheapest(self):
+        tree = ModelTree(models.A, statistics=self.large)
+        self.assertEqual(path(tree, models.D), [models.C, models.D])
+
+        # Shorter paths are never traded for cheaper ones
+        self.assertEqual(path(tree, models.G), [models.B, models.G])
+
+    def test_required_routes(self):
+        tree = ModelTree(models.A, statistics=self.large, required_routes=[
+            {'source': 'tests.B', 'target': 'tests.D'}])
+
+        self.assertEqual(path(tree, models.D), [models.B, models.D])
+
+    def test_fingerprint(self):
+        def fingerprint(rows):
+            return snapshots.fingerprint(ModelTree(
+                models.A, statistics=StaticStatistics(rows={'tests_b': rows})))
+
+        # Only the magnitude of row counts matters
+        self.assertEqual(fingerprint(1000), fingerprint(1010))
+        self.assertNotEqual(fingerprint(1000), fingerprint(10 ** 6))
+        self.assertNotEqual(fingerprint(1000),
+                            snapshots.fingerprint(ModelTree(models.A)))
+
+    def test_fingerprint_tables(self):
+        stats = RecordedStatistics()
+        tree = ModelTree(models.A, statistics=stats)
+
+        stats.tables.clear()
+        snapshots.fingerprint(tree)
+
+        # Only the statistics of the tables of the tree are read
+        self.assertIn('tests_b', stats.tables)
+        self.assertNotIn('tests_employee', stats.tables)
+
+
+class DatabaseStatisticsTestCase(TestCase):
+    def setUp(self):
+        title = models.Title.objects.create(name='Engineer', salary=10)
+        office = models.Office.objects.create(location='Outer Space')
+
+        for i in range(3):
+            models.Employee.objects.create(first_name=str(i), last_name='',
+                                           title=title, office=office)
+
+    def test_statistics(self):
+        stats = DatabaseStatistics()
+
+        self.assertEqual(stats.row_count('tests_employee'), 3)
+        self.assertTrue(stats.is_indexed('tests_employee', 'id'))
+        self.assertTrue(stats.is_indexed('tests_employee', 'title_id'))
+        self.assertFalse(stats.is_indexed('tests_employee', 'last_name'))
+
+        # Cached until cleared
+        models.Employee.objects.all().delete()
+        self.assertEqual(stats.row_count('tests_employee'), 3)
+
+        stats.clear()
+        self.assertEqual(stats.row_count('tests_employee'), 0)
+
+    def test_tree(self):
+        tree = ModelTree(models.Employee, statistics=True)
+        self.assertEqual(path(tree, models.Title), [models.Title])
+
+    def test_missing_table(self):
+        stats = DatabaseStatistics()
+
+        self.assertEqual(stats.row_count('tests_missing'), 0)
+        self.assertFalse(stats.is_indexed('tests_missing', 'id'))
+
+    def test_pickle(self):
+        tree = ModelTree(models.Employee, statistics=True)
+        qs = models.Employee.branches.filter(title__salary=10)
+        qs.tree = tree
+
+        loaded = pickle.loads(pickle.dumps(qs))
+        self.assertEqual(loaded.tree.cost_model.statistics.row_count(
+            'tests_employee'), 3)
+
+    def test_shared(self):
+        stats = database_statistics()
+
+        # Trees of the same database share their statistics
+        self.assertIs(ModelTree(models.Employee, statistics=True)
+                      .cost_model.statistics, stats)
+        self.assertIs(ModelTree(models.Office, statistics='default')
+                      .cost_model.statistics, stats)
+        self.assertIsNot(database_statistics('other'), stats)
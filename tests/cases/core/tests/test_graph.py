@@ -0,0 +1,125 @@
+import gc
+
+from django.test import TestCase
+from modeltree.costs import StaticStatistics
+from modeltree.graph import ModelGraph, graph
+from modeltree.tree import LazyModelTrees, ModelTree
+from tests import models
+
+from .test_build import LegacyModelTree, flatten
+
+__all__ = ('ModelGraphTestCase',)
+
+
+class ModelGraphTestCase(TestCase):
+    def setUp(self):
+        graph.clear()
+
+    def test_shared(self):
+        tree = ModelTree(models.Employee)
+        hits = graph.stats()['hits']
+        other = ModelTree(models.Employee)
+
+        # The second tree is a view of the nodes of the first
+        self.assertIs(other.root_node, tree.root_node)
+        self.assertIs(other._paths, tree._paths)
+        self.assertEqual(graph.stats()['hits'], hits + 1)
+
+        self.assertEqual(flatten(tree.root_node),
+                         flatten(LegacyModelTree(models.Employee).root_node))
+
+        self.assertEqual(
+            str(other.add_joins(models.Project)[0].query),
+            str(tree.add_joins(models.Project)[0].query))
+
+    def test_policy(self):
+        tree = ModelTree(models.Employee)
+
+        routes = [{'source': 'tests.Project', 'target': 'tests.Meeting'}]
+
+        excluded = ModelTree(models.Employee, excluded_models=['tests.Title'])
+        required = ModelTree(models.Employee, required_routes=routes)
+        costs = ModelTree(models.Employee, route_costs=[
+            {'source': 'tests.Employee', 'target': 'tests.Meeting',
+             'cost': 2}])
+
+        for other in (excluded, required, costs):
+            self.assertIsNot(other.root_node, tree.root_node)
+
+        self.assertNotIn(models.Title, excluded._nodes)
+        self.assertIs(ModelTree(models.Employee, required_routes=routes)
+                      .root_node, required.root_node)
+
+        # Paths chosen by statistics are never shared
+        statistics = StaticStatistics()
+        self.assertIsNone(ModelTree(models.Employee, statistics=statistics)
+                          .policy_key())
+
+    def test_subclass(self):
+        class OfficeTree(ModelTree):
+            "Does not join offices."
+            def _join_allowed(self, source, target, field=None):
+                return target is not models.Office and super(
+                    OfficeTree, self)._join_allowed(source, target, field)
+
+        tree = ModelTree(models.Employee)
+        other = OfficeTree(models.Employee)
+
+        # Subclasses may traverse the relations differently
+        self.assertIsNot(other.root_node, tree.root_node)
+        self.assertIn(models.Office, tree._nodes)
+        self.assertNotIn(models.Office, other._nodes)
+        self.assertIs(OfficeTree(models.Employee).root_node, other.root_node)
+
+    def test_bounded(self):
+        graph = ModelGraph(maxsize=1)
+
+        class Tree(object):
+            pass
+
+        a = graph.plan('a', lambda: 1)
+
+        # Plans are kept when no tree uses them
+        del a
+        gc.collect()
+
+        self.assertEqual(graph.plan('a', lambda: 2).state, 1)
+
+        tree = Tree()
+        tree.plan = graph.plan('b', lambda: 3)
+        self.assertEqual(graph.stats(), {
+            'hits': 1, 'misses': 2, 'evictions': 1, 'size': 1,
+            'maxsize': 1, 'used': 1})
+
+        # The least recently used plan is freed once evicted
+        gc.collect()
+        self.assertEqual(graph.plan('a', lambda: 4).state, 4)
+
+        # Evicted plans are shared while a tree uses them
+        self.assertIs(graph.plan('b', lambda: 5), tree.plan)
+
+        del tree
+        graph.plan('a', lambda: 6)
+        gc.collect()
+
+        self.assertEqual(graph.plan('b', lambda: 7).state, 7)
+
+    def test_evicted(self):
+        trees = LazyModelTrees({}, max_trees=1)
+
+        # A policy no other tree has
+        tree = trees.create('office', models.Office,
+                            excluded_models=['tests.Meeting'])
+        plan = tree._plan
+        del tree
+
+        trees[models.Title]
+        gc.collect()
+
+        # Evicted trees are created again without traversing the relations
+        misses = graph.stats()['misses']
+        tree = trees.create('office', models.Office,
+                            excluded_models=['tests.Meeting'])
+
+        self.assertIs(tree._plan, plan)
+        self.assertEqual(graph.stats()['misses'], misses)
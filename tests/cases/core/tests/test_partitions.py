@@ -0,0 +1,57 @@
+from unittest import skipIf
+
+from django.test import TransactionTestCase, override_settings
+from modeltree import executor
+from modeltree.query import partition_ranges
+from tests import models
+from .fixtures import EmployeesMixin
+
+__all__ = ('PartitionTestCase',)
+
+
+@skipIf(executor.ThreadPoolExecutor is None,
+        'concurrent.futures is required')
+class PartitionTestCase(EmployeesMixin, TransactionTestCase):
+    available_apps = ['tests']
+    size = 250
+
+    def setUp(self):
+        super(PartitionTestCase, self).setUp()
+
+        self.salary = models.Title._meta.get_field('salary')
+
+    def test_ranges(self):
+        self.assertEqual(partition_ranges(1, 10, 3),
+                         [(1, 4), (5, 8), (9, 10)])
+        self.assertEqual(partition_ranges(5, 6, 4), [(5, 5), (6, 6)])
+
+    def test_ordered(self):
+        qs = models.Employee.branches.select(self.salary).order_by('id')
+        rows = list(qs.raw_parallel(partitions=7))
+
+        self.assertEqual(rows, list(qs.raw()))
+
+    def test_unordered(self):
+        qs = models.Employee.branches.filter(first_name__endswith='1')\
+            .select(self.salary)
+
+        rows = list(qs.raw_parallel(partitions=7, ordered=False))
+
+        self.assertEqual(sorted(rows), sorted(qs.raw()))
+
+    def test_empty(self):
+        qs = models.Employee.branches.filter(first_name='Nobody')
+        self.assertEqual(list(qs.raw_parallel()), [])
+
+    def test_sliced(self):
+        qs = models.Employee.branches.all()[:10]
+        self.assertRaises(ValueError, qs.raw_parallel)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, partition_ranges, 1, 10, 0)
+
+        qs = models.Employee.branches.all()
+        self.assertRaises(ValueError, qs.raw_parallel, partitions=0)
+
+        with override_settings(MODELTREE_WORKERS=0):
+            self.assertRaises(ValueError, qs.raw_parallel)
@@ -1,7 +1,15 @@
+import array
+import pickle
+from unittest import skipIf
+
+from django.db import connection
 from django.test import TestCase
+from modeltree.query import encode_cursor, fetch_chunks, numpy
 from tests import models
+from .fixtures import EmployeesMixin
 
-__all__ = ('ModelTreeQuerySetTestCase',)
+__all__ = ('ModelTreeQuerySetTestCase', 'StreamTestCase', 'ColumnsTestCase',
+           'PageTestCase')
 
 
 class ModelTreeQuerySetTestCase(TestCase):
@@ -60,3 +68,206 @@ class ModelTreeQuerySetTestCase(TestCase):
             '"tests_meeting_attendees"."employee_id") LEFT OUTER JOIN '
             '"tests_meeting" ON ("tests_meeting_attendees"."meeting_id" = '
             '"tests_meeting"."id")'.replace(' ', ''))
+
+    def test_select_shared_paths(self):
+        salary = models.Title._meta.get_field('salary')
+        title = models.Title._meta.get_field('name')
+        name = models.Project._meta.get_field('name')
+        due_date = models.Project._meta.get_field('due_date')
+
+        qs = models.Employee.branches.all()
+        selected = qs.select(salary, name, title, due_date)
+
+        # The original queryset is untouched
+        self.assertTrue(qs.query.default_cols)
+
+        self.assertEqual(
+            str(selected.query).replace(' ', ''),
+            'SELECT "tests_employee"."id", "tests_title"."salary", '
+            '"tests_project"."name", "tests_title"."name", '
+            '"tests_project"."due_date" FROM "tests_employee" INNER JOIN '
+            '"tests_title" ON ("tests_employee"."title_id" = '
+            '"tests_title"."id") LEFT OUTER JOIN "tests_project_employees" '
+            'ON ("tests_employee"."id" = '
+            '"tests_project_employees"."employee_id") LEFT OUTER JOIN '
+            '"tests_project" ON ("tests_project_employees"."project_id" = '
+            '"tests_project"."id")'.replace(' ', ''))
+
+        # Each table is joined and referenced once
+        query = selected.query
+        self.assertEqual(len(query.alias_map), 4)
+        self.assertEqual(set(query.alias_refcount.values()), {1})
+
+    def test_pickle(self):
+        qs = models.Employee.branches.filter(title__salary__lt=50000)
+
+        # Fills the caches of the tree
+        qs.template('title__salary__gt')
+
+        loaded = pickle.loads(pickle.dumps(qs))
+        self.assertEqual(str(loaded.query), str(qs.query))
+        self.assertEqual(list(loaded), list(qs))
+
+
+class StreamTestCase(EmployeesMixin, TestCase):
+    size = 2500
+
+    def test_raw(self):
+        salary = models.Title._meta.get_field('salary')
+        location = models.Office._meta.get_field('location')
+
+        qs = models.Employee.branches.select(salary, location)\
+            .order_by('id')
+
+        rows = list(qs.raw(chunk_size=100))
+
+        self.assertEqual(len(rows), self.size)
+        self.assertEqual(rows, list(qs.raw()))
+        self.assertEqual(rows[0][1:], (10, 'Outer Space'))
+
+    def test_chunks(self):
+        qs = models.Employee.branches.all()
+        sql, params = qs.query.get_compiler(qs.db).as_sql()
+
+        sizes = [len(rows) for rows in
+                 fetch_chunks(connection, sql, params, 1000)]
+
+        self.assertEqual(sizes, [1000, 1000, 500])
+
+    def test_converters(self):
+        date = models.Project._meta.get_field('due_date')
+        employee = models.Employee.objects.all()[0]
+
+        project = models.Project.objects.create(
+            name='Apollo', manager=employee, due_date='2020-01-01')
+        project.employees.add(employee)
+
+        qs = models.Employee.branches.filter(project__name='Apollo')\
+            .select(date)
+
+        self.assertEqual(list(qs.raw(chunk_size=10)), list(qs.raw()))
+
+    def test_empty(self):
+        qs = models.Employee.branches.filter(id__in=[])
+        self.assertEqual(list(qs.raw(chunk_size=10)), [])
+
+
+class ColumnsTestCase(EmployeesMixin, TestCase):
+    size = 250
+
+    def setUp(self):
+        super(ColumnsTestCase, self).setUp()
+
+        self.salary = models.Title._meta.get_field('salary')
+        self.location = models.Office._meta.get_field('location')
+        self.manager = models.Employee._meta.get_field('manager')
+
+    def test_columns(self):
+        qs = models.Employee.branches.select(self.salary, self.location)\
+            .order_by('id')
+
+        ids, salaries, locations = qs.columns(chunk_size=100)
+
+        self.assertIsInstance(ids, array.array)
+        self.assertIsInstance(salaries, array.array)
+        self.assertIsInstance(locations, list)
+
+        self.assertEqual(list(zip(ids, salaries, locations)), list(qs.raw()))
+
+    def test_nulls(self):
+        qs = models.Employee.branches.select(self.manager).order_by('id')
+        employee = models.Employee.objects.order_by('id')[self.size - 1]
+
+        models.Employee.objects.exclude(pk=employee.pk)\
+            .update(manager=employee)
+
+        ids, managers = qs.columns(chunk_size=100)
+
+        # The NULL is only seen in the last chunk
+        self.assertIsInstance(managers, list)
+        self.assertEqual(list(zip(ids, managers)), list(qs.raw()))
+
+    def test_empty(self):
+        qs = models.Employee.branches.filter(id__in=[]).select(self.salary)
+        self.assertEqual([list(c) for c in qs.columns()], [[], []])
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_ndarray(self):
+        qs = models.Employee.branches.select(self.salary, self.location)\
+            .order_by('id')
+
+        ids, salaries, locations = qs.columns(ndarray=True)
+
+        self.assertEqual(ids.dtype.kind, 'i')
+        self.assertEqual(int(salaries.sum()), 10 * self.size)
+        self.assertEqual(locations.dtype, object)
+        self.assertEqual(list(zip(ids.tolist(), salaries.tolist(),
+                                  locations.tolist())), list(qs.raw()))
+
+
+class PageTestCase(EmployeesMixin, TestCase):
+    size = 25
+
+    def setUp(self):
+        super(PageTestCase, self).setUp()
+
+        self.salary = models.Title._meta.get_field('salary')
+        self.project = models.Project._meta.get_field('name')
+
+    def pages(self, queryset, size):
+        pages = []
+        cursor = None
+
+        while True:
+            rows, cursor = queryset.page(size, cursor)
+            pages.append(rows)
+
+            if cursor is None:
+                return pages
+
+    def test_pages(self):
+        qs = models.Employee.branches.select(self.salary)
+
+        with self.assertNumQueries(2):
+            qs.page(10)
+
+        pages = self.pages(qs, 10)
+
+        self.assertEqual([len(rows) for rows in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), list(qs.order_by('id').raw()))
+
+    def test_exact(self):
+        qs = models.Employee.branches.select(self.salary)
+        self.assertEqual([len(rows) for rows in self.pages(qs, 5)],
+                         [5] * 5)
+
+        self.assertEqual(models.Employee.branches.filter(id__in=[])
+                         .page(10), ([], None))
+
+    def test_fan_out(self):
+        employees = list(models.Employee.objects.order_by('id'))
+
+        for i in range(3):
+            project = models.Project.objects.create(
+                name='P{0}'.format(i), manager=employees[0],
+                due_date='2020-01-01')
+            project.employees.add(*employees[i:i + 5])
+
+        qs = models.Employee.branches.select(self.project)\
+            .order_by('project__name')
+
+        pages = self.pages(qs, 3)
+
+        # Each page holds all rows of exactly 3 root rows
+        for rows in pages[:-1]:
+            self.assertEqual(len(set(row[0] for row in rows)), 3)
+
+        self.assertEqual(sum(pages, []), list(
+            qs.order_by('id', 'project__name').raw()))
+
+    def test_invalid(self):
+        qs = models.Employee.branches.all()
+
+        self.assertRaises(ValueError, qs.page, 10, 'invalid')
+        self.assertRaises(ValueError, qs.page, 10, encode_cursor('abc'))
+        self.assertRaises(ValueError, qs[:5].page, 10)
@@ -0,0 +1,57 @@
+from django.test import TestCase
+from modeltree.relations import RelationIndex, relations
+from modeltree.tree import ModelTree
+from tests.models import Employee, Meeting, Office, Project, Title
+
+__all__ = ('RelationIndexTestCase',)
+
+
+class RelationIndexTestCase(TestCase):
+    def test_relations(self):
+        index = RelationIndex()
+
+        self.assertEqual([
+            (r.target, r.relation, r.reverse, r.related_name,
+             r.accessor_name, r.nullable)
+            for r in index[Employee]
+        ], [
+            (Title, 'foreignkey', False, 'title', 'title', False),
+            (Office, 'foreignkey', False, 'office', 'office', False),
+            (Employee, 'foreignkey', False, 'manager', 'manager', True),
+            (Project, 'manytomany', True, 'project', 'project_set', True),
+            (Meeting, 'manytomany', True, 'meeting', 'meeting_set', True),
+            (Employee, 'foreignkey', True, 'managed_employees',
+             'managed_employees', True),
+        ])
+
+        title = index[Employee][0]
+        self.assertIs(title.field, Employee._meta.get_field('title'))
+        self.assertIs(title.join_field, title.field)
+
+        project = index[Employee][3]
+        self.assertIs(project.field, Project._meta.get_field('employees'))
+        self.assertIs(project.join_field,
+                      Employee._meta.get_field('project'))
+
+    def test_shared(self):
+        ModelTree(Office)
+        cached = relations[Employee]
+
+        ModelTree(Title)
+        self.assertIs(relations[Employee], cached)
+
+    def test_expired(self):
+        index = RelationIndex()
+        cached = index[Office]
+
+        # Registering a new model expires the field caches
+        Office._meta._expire_cache()
+        self.assertIsNot(index[Office], cached)
+        self.assertEqual(index[Office], cached)
+
+    def test_build(self):
+        index = RelationIndex()
+        index.build()
+
+        self.assertIn(Employee, index)
+        self.assertEqual(len(index), len(index.registry.get_models()))
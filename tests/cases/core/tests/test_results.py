@@ -0,0 +1,162 @@
+from unittest import skipIf
+
+from django.db import transaction
+from django.test import TransactionTestCase
+from modeltree import results
+from tests import models
+
+__all__ = ('ResultCacheTestCase',)
+
+
+class ResultCacheTestCase(TransactionTestCase):
+    # Changes are committed so their results can be cached
+    available_apps = ['tests']
+
+    def setUp(self):
+        results.get_cache().clear()
+
+        self.title = models.Title.objects.create(name='Engineer', salary=10)
+        self.office = models.Office.objects.create(location='Outer Space')
+        self.employee = models.Employee.objects.create(
+            first_name='One', last_name='Last', title=self.title,
+            office=self.office)
+
+        self.salary = models.Title._meta.get_field('salary')
+
+    def test_count(self):
+        qs = models.Employee.branches.cached().filter(title__salary=10)
+
+        self.assertEqual(qs.count(), 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(qs.count(), 1)
+
+        # A fresh queryset with the same SQL shares the entry
+        with self.assertNumQueries(0):
+            models.Employee.branches.cached().filter(title__salary=10)\
+                .count()
+
+        # Not cached unless requested
+        with self.assertNumQueries(1):
+            models.Employee.branches.filter(title__salary=10).count()
+
+    def test_invalidation(self):
+        qs = models.Employee.branches.cached().filter(title__salary=10)
+        qs.count()
+
+        # Changes of tables outside of the query keep the entry
+        self.office.save()
+
+        with self.assertNumQueries(0):
+            qs.count()
+
+        self.title.salary = 20
+        self.title.save()
+
+        self.assertEqual(qs.count(), 0)
+
+    def test_m2m(self):
+        project = models.Project.objects.create(
+            name='P1', manager=self.employee, due_date='2020-01-01')
+
+        qs = models.Employee.branches.cached().filter(project__name='P1')
+        self.assertEqual(qs.tree_count(), 0)
+
+        project.employees.add(self.employee)
+        self.assertEqual(qs.tree_count(), 1)
+
+    def test_raw(self):
+        qs = models.Employee.branches.cached().select(self.salary)
+
+        self.assertEqual(list(qs.raw()), [(self.employee.pk, 10)])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(list(qs.raw()), [(self.employee.pk, 10)])
+
+    def test_manual(self):
+        qs = models.Employee.branches.cached().select(self.salary)
+        list(qs.raw())
+
+        # Updates do not send signals
+        models.Title.objects.update(salary=30)
+        self.assertEqual(list(qs.raw()), [(self.employee.pk, 10)])
+
+        results.invalidate(models.Title)
+        self.assertEqual(list(qs.raw()), [(self.employee.pk, 30)])
+
+    def test_rollback(self):
+        qs = models.Employee.branches.cached().filter(title__salary=20)
+
+        try:
+            with transaction.atomic():
+                self.title.salary = 20
+                self.title.save()
+
+                self.assertEqual(qs.count(), 1)
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertEqual(qs.count(), 0)
+
+    @skipIf(not hasattr(transaction, 'on_commit'), 'requires commit hooks')
+    def test_commit(self):
+        qs = models.Employee.branches.cached().filter(title__salary=20)
+
+        with transaction.atomic():
+            self.title.salary = 20
+            self.title.save()
+
+            self.assertEqual(qs.count(), 1)
+
+            # Queries of tables the transaction did not change are cached
+            office = models.Employee.branches.cached()\
+                .filter(office__location='Outer Space')
+            office.count()
+
+            with self.assertNumQueries(0):
+                office.count()
+
+        self.assertEqual(qs.count(), 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(qs.count(), 1)
+
+    @skipIf(not hasattr(transaction, 'on_commit'), 'requires commit hooks')
+    def test_later_transactions(self):
+        with transaction.atomic():
+            self.title.save()
+
+        qs = models.Employee.branches.cached().filter(title__salary=10)
+
+        # The changes of committed transactions do not prevent caching,
+        # e.g. of requests with ATOMIC_REQUESTS
+        for i in range(3):
+            results.get_cache().clear()
+
+            with transaction.atomic():
+                with self.assertNumQueries(1):
+                    qs.count()
+                    qs.count()
+
+    def test_savepoint_rollback(self):
+        qs = models.Employee.branches.cached().filter(title__salary=10)
+
+        with transaction.atomic():
+            self.title.save()
+
+            try:
+                with transaction.atomic():
+                    self.office.save()
+                    raise ValueError
+            except ValueError:
+                pass
+
+            # The change of the title is still pending
+            with self.assertNumQueries(2):
+                qs.count()
+                qs.count()
+
+    def test_connected(self):
+        # The handlers are connected on startup
+        self.assertTrue(results._connected)
@@ -1,9 +1,11 @@
 # flake8: noqa: F405
 from django.test import TestCase
+from modeltree import snapshots
 from modeltree.tree import ModelTree
 from tests.models import *  # noqa
 
-__all__ = ('RouterTestCase', 'FieldRouterTestCase')
+__all__ = ('RouterTestCase', 'FieldRouterTestCase', 'ExplainJoinTestCase',
+           'RouteCostTestCase')
 
 
 def compare_paths(self, tree, expected_paths):
@@ -300,3 +302,86 @@ class FieldRouterTestCase(TestCase):
 
         with self.assertRaises(ValueError):
             ModelTree(A, **kwargs)
+
+
+class ExplainJoinTestCase(TestCase):
+    def setUp(self):
+        self.tree = ModelTree(A, **{
+            'excluded_models': ['tests.K'],
+            'required_routes': [{
+                'target': 'tests.E',
+                'source': 'tests.D',
+                'field': 'D.e1_set',
+            }],
+            'excluded_routes': [{
+                'target': 'tests.D',
+                'source': 'tests.B',
+            }],
+        })
+
+    def test_allowed(self):
+        self.assertIsNone(self.tree.explain_join(C, D))
+        self.assertIsNone(self.tree.explain_join('tests.D', 'tests.E',
+                                                 'D.e1_set'))
+
+    def test_rejected(self):
+        self.assertEqual(self.tree.explain_join(D, D),
+                         'joins to the same model are not allowed')
+        self.assertEqual(self.tree.explain_join(J, K),
+                         'the model tests.K is excluded')
+        self.assertEqual(self.tree.explain_join(B, A),
+                         'joins back to the root model are not allowed')
+        self.assertEqual(self.tree.explain_join(B, D),
+                         'the route tests.B -> tests.D is excluded')
+        self.assertEqual(self.tree.explain_join('tests.D', 'tests.E',
+                                                'D.e'),
+                         'the route tests.D -> tests.E via E.d1 is required')
+        self.assertEqual(self.tree.explain_join(J, E),
+                         'the route tests.D -> tests.E via E.d1 is required')
+
+
+class RouteCostTestCase(TestCase):
+    def path(self, tree, model):
+        return [n.model for n in tree._node_path(model)]
+
+    def test_tie(self):
+        # A cost breaks the tie between paths of equal length
+        tree = ModelTree(A, route_costs=[
+            {'source': 'tests.A', 'target': 'tests.B', 'cost': 1}])
+
+        self.assertEqual(self.path(tree, D), [C, D])
+        self.assertEqual(self.path(tree, G), [B, G])
+
+    def test_detour(self):
+        # A costly route is avoided if a somewhat longer path exists
+        tree = ModelTree(A, route_costs=[
+            {'source': 'tests.A', 'target': 'tests.B', 'cost': 3}])
+
+        self.assertEqual(self.path(tree, G), [C, D, B, G])
+        self.assertEqual(self.path(tree, H), [C, D, F, H])
+
+    def test_field(self):
+        tree = ModelTree(A, route_costs=[
+            {'source': 'tests.D', 'target': 'tests.E', 'field': 'E.d',
+             'cost': 1}])
+
+        self.assertEqual([n.accessor_name for n in tree._node_path(E)],
+                         ['b_set', 'd_set', 'e1_set'])
+
+    def test_required_routes(self):
+        tree = ModelTree(A, route_costs=[
+            {'source': 'tests.A', 'target': 'tests.B', 'cost': 3}
+        ], required_routes=[{'source': 'tests.B', 'target': 'tests.G'}])
+
+        self.assertEqual(self.path(tree, G), [C, D, B, G])
+
+    def test_fingerprint(self):
+        costs = [{'source': 'tests.A', 'target': 'tests.B', 'cost': 1}]
+
+        self.assertNotEqual(
+            snapshots.fingerprint(ModelTree(A)),
+            snapshots.fingerprint(ModelTree(A, route_costs=costs)))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, ModelTree, A, route_costs=[
+            {'source': 'tests.A', 'target': 'tests.B', 'cost': -1}])
@@ -0,0 +1,86 @@
+from django.test import TestCase
+from modeltree.query import ModelTreeQuerySet
+from modeltree.tree import ModelTree
+from tests import models
+
+__all__ = ('SemijoinTestCase',)
+
+
+class SemijoinTestCase(TestCase):
+    def setUp(self):
+        office = models.Office.objects.create(location='Outer Space')
+        title = models.Title.objects.create(name='Engineer', salary=10)
+
+        self.e1, self.e2, self.e3 = [
+            models.Employee.objects.create(first_name=name, last_name='Last',
+                                           title=title, office=office)
+            for name in ('One', 'Two', 'Three')
+        ]
+
+        p1 = models.Project.objects.create(name='P1', manager=self.e1,
+                                           due_date='2020-01-01')
+        p2 = models.Project.objects.create(name='P2', manager=self.e1,
+                                           due_date='2020-06-01')
+        p1.employees.add(self.e1, self.e2)
+        p2.employees.add(self.e1)
+
+    def ids(self, queryset):
+        return sorted(queryset.values_list('pk', flat=True))
+
+    def test_sql(self):
+        qs = models.Employee.branches.semijoin()\
+            .filter(project__name='P1', title__salary=10)
+
+        sql = str(qs.query)
+
+        self.assertIn('WHERE EXISTS (SELECT (1) AS "a" FROM', sql)
+        self.assertNotIn('"tests_project"', sql.split('EXISTS')[0])
+
+        # To-one conditions on their own are still joined
+        qs = models.Employee.branches.semijoin().filter(title__salary=10)
+
+        self.assertNotIn('EXISTS', str(qs.query))
+        self.assertIn('INNER JOIN "tests_title"', str(qs.query))
+
+    def test_filter(self):
+        qs = models.Employee.branches.semijoin()\
+            .filter(project__name__in=['P1', 'P2'])
+
+        self.assertEqual(list(qs.order_by('pk')), [self.e1, self.e2])
+        self.assertEqual(qs.count(), 2)
+
+    def test_same_row(self):
+        # Conditions of one call must match the same project, as with joins
+        kwargs = {'project__name': 'P2', 'project__due_date': '2020-01-01'}
+
+        qs = models.Employee.branches.semijoin().filter(**kwargs)
+
+        self.assertEqual(self.ids(qs),
+                         self.ids(models.Employee.branches.filter(**kwargs)))
+        self.assertEqual(self.ids(qs), [])
+
+    def test_exclude(self):
+        qs = models.Employee.branches.semijoin().exclude(project__name='P1')
+
+        self.assertEqual(self.ids(qs), [self.e3.pk])
+        self.assertEqual(
+            self.ids(qs),
+            self.ids(models.Employee.objects.exclude(project__name='P1')))
+
+    def test_subquery(self):
+        # The correlation follows the aliases of the outer query
+        qs = models.Employee.branches.semijoin().filter(project__name='P2')
+        outer = models.Employee.objects.filter(pk__in=qs.values('pk'))
+
+        self.assertEqual(self.ids(outer), [self.e1.pk])
+
+    def test_tree_option(self):
+        tree = ModelTree(models.Employee, semijoin=True)
+        qs = ModelTreeQuerySet(tree).filter(project__name='P1')
+
+        self.assertIn('EXISTS', str(qs.query))
+        self.assertNotIn('JOIN', str(qs.query).split('EXISTS')[0])
+
+        # Overridden per queryset
+        qs = qs.semijoin(False).filter(project__name='P2')
+        self.assertIn('JOIN "tests_project"', str(qs.query).split('EXISTS')[0])
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import warnings
+
+from django.conf import settings
+from django.test import TestCase
+from modeltree import snapshots
+from modeltree.tree import ModelTree, LazyModelTrees
+from tests import models
+from .test_build import flatten
+
+__all__ = ('SnapshotTestCase',)
+
+
+class SnapshotTree(ModelTree):
+    "Counts the trees built by traversing the schema."
+    traversals = 0
+
+    def policy_key(self):
+        # Never shares the trees built before, so snapshots are loaded
+        return
+
+    def _traverse(self):
+        SnapshotTree.traversals += 1
+        super(SnapshotTree, self)._traverse()
+
+
+class SnapshotTestCase(TestCase):
+    def setUp(self):
+        self.snapshot_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.snapshot_dir)
+
+    def test_save_load(self):
+        tree = SnapshotTree(models.Office, snapshot_dir=self.snapshot_dir)
+        path = snapshots.snapshot_path(self.snapshot_dir, tree)
+        self.assertTrue(os.path.exists(path))
+
+        traversals = SnapshotTree.traversals
+        loaded = SnapshotTree(models.Office, snapshot_dir=self.snapshot_dir)
+
+        self.assertEqual(SnapshotTree.traversals, traversals)
+        self.assertEqual(flatten(loaded.root_node), flatten(tree.root_node))
+        self.assertEqual(loaded.query_string(models.Title),
+                         'employee__title')
+        self.assertEqual(loaded.get_model('project'), models.Project)
+
+    def test_route_config(self):
+        SnapshotTree(models.A, snapshot_dir=self.snapshot_dir)
+
+        kwargs = {
+            'required_routes': [{'source': 'tests.C', 'target': 'tests.D'}],
+            'snapshot_dir': self.snapshot_dir,
+        }
+
+        # Different configuration, different fingerprint
+        traversals = SnapshotTree.traversals
+        tree = SnapshotTree(models.A, **kwargs)
+
+        self.assertEqual(SnapshotTree.traversals, traversals + 1)
+        self.assertEqual(len(os.listdir(self.snapshot_dir)), 2)
+        self.assertEqual(tree.query_string(models.D), 'c__d')
+
+    def test_class(self):
+        ModelTree(models.Office, snapshot_dir=self.snapshot_dir)
+
+        # Subclasses may build different trees
+        traversals = SnapshotTree.traversals
+        SnapshotTree(models.Office, snapshot_dir=self.snapshot_dir)
+
+        self.assertEqual(SnapshotTree.traversals, traversals + 1)
+        self.assertEqual(len(os.listdir(self.snapshot_dir)), 2)
+
+    def test_stale(self):
+        tree = ModelTree(models.Office)
+        path = os.path.join(self.snapshot_dir, 'office.json')
+        tree.save_snapshot(path)
+
+        other = ModelTree(models.Title)
+        self.assertFalse(other.load_snapshot(path))
+        self.assertEqual(other.query_string(models.Office),
+                         'employee__office')
+
+        self.assertTrue(ModelTree(models.Office).load_snapshot(path))
+
+    def test_corrupt(self):
+        tree = SnapshotTree(models.Office)
+        path = snapshots.snapshot_path(self.snapshot_dir, tree)
+
+        with open(path, 'w') as f:
+            f.write('{"version": 1, "nodes": [')
+
+        tree = SnapshotTree(models.Office, snapshot_dir=self.snapshot_dir)
+        self.assertEqual(tree.query_string(models.Title), 'employee__title')
+
+        # Rewritten after the build
+        self.assertTrue(SnapshotTree(models.Office).load_snapshot(path))
+
+    def test_unwritable(self):
+        # A file is not a directory the snapshot can be written to
+        path = os.path.join(self.snapshot_dir, 'file')
+        open(path, 'w').close()
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            tree = ModelTree(models.Office, snapshot_dir=path)
+
+        self.assertEqual(tree.query_string(models.Title), 'employee__title')
+        self.assertTrue(any(issubclass(x.category, RuntimeWarning)
+                            for x in w))
+
+    def test_lazy_trees(self):
+        trees = LazyModelTrees(getattr(settings, 'MODELTREES', {}),
+                               snapshot_dir=self.snapshot_dir)
+        tree = trees['default']
+
+        path = snapshots.snapshot_path(self.snapshot_dir, tree)
+        self.assertTrue(os.path.exists(path))
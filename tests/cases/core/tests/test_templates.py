@@ -0,0 +1,120 @@
+import datetime
+
+from django.test import TestCase
+from modeltree.templates import QueryTemplate
+from tests import models
+
+__all__ = ('QueryTemplateTestCase',)
+
+
+class QueryTemplateTestCase(TestCase):
+    def setUp(self):
+        office = models.Office.objects.create(location='Outer Space')
+
+        for i, salary in enumerate([10, 20, 30]):
+            title = models.Title.objects.create(
+                name='Title {0}'.format(i), salary=salary)
+            employee = models.Employee.objects.create(
+                first_name='First {0}'.format(i), last_name='Last',
+                title=title, office=office)
+            project = models.Project.objects.create(
+                name='Project {0}'.format(i), manager=employee,
+                due_date=datetime.date(2020, 1, i + 1))
+            project.employees.add(employee)
+
+        self.salary = models.Title._meta.get_field('salary')
+
+    def test_raw(self):
+        template = models.Employee.branches.template(
+            'title__salary__gt', fields=[self.salary])
+
+        for value in (0, 15, 30):
+            self.assertEqual(
+                sorted(template.raw(title__salary__gt=value)),
+                sorted(models.Employee.branches.select(self.salary)
+                       .filter(title__salary__gt=value).raw()))
+
+    def test_compiled_once(self):
+        template = models.Employee.branches.template(
+            'title__salary__gt', fields=[self.salary])
+
+        # The same shape is not compiled again
+        self.assertIs(models.Employee.branches.template(
+            'title__salary__gt', fields=[self.salary]), template)
+        self.assertIsNot(models.Employee.branches.template(
+            'title__salary__lt', fields=[self.salary]), template)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(template.raw(title__salary__gt=15))),
+                             2)
+
+    def test_filtered(self):
+        qs = models.Employee.branches.filter(office__location='Moon')
+        template = qs.template('title__salary__gt')
+
+        # The shape of a filtered query is not known from the key
+        self.assertIsNot(qs.template('title__salary__gt'), template)
+        self.assertEqual(list(template.raw(title__salary__gt=0)), [])
+
+    def test_shape(self):
+        qs = models.Employee.branches.all()
+        template = qs.template('project__name')
+
+        # Semijoins and other options change the SQL of the query
+        self.assertIsNot(qs.semijoin().template('project__name'), template)
+        self.assertIsNot(qs.select_related('title').template('project__name'),
+                         template)
+        self.assertIsNot(qs.only('first_name').template('project__name'),
+                         template)
+        self.assertIsNot(qs.defer('first_name').template('project__name'),
+                         template)
+
+        self.assertIs(qs.semijoin(False).template('project__name'), template)
+
+        sql = qs.semijoin().template('project__name')\
+            .as_sql(project__name='Project 0')[1]
+        self.assertIn('EXISTS', sql)
+
+    def test_values(self):
+        qs = models.Employee.branches.all()
+
+        template = qs.template('first_name__startswith', 'project__due_date')
+        self.assertEqual(len(list(template.raw(
+            first_name__startswith='First',
+            project__due_date=datetime.date(2020, 1, 2)))), 1)
+
+        template = qs.template('first_name__icontains')
+        self.assertEqual(
+            len(list(template.raw(first_name__icontains='ST 1'))), 1)
+
+    def test_semijoin(self):
+        qs = models.Employee.branches.semijoin()
+        template = qs.template('project__name', 'title__salary__lt')
+
+        rows = list(template.raw(project__name='Project 0',
+                                 title__salary__lt=15))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(list(template.raw(project__name='Project 0',
+                                           title__salary__lt=5)), [])
+
+    def test_errors(self):
+        template = models.Employee.branches.template('title__salary__gt')
+
+        with self.assertRaises(TypeError):
+            template.raw()
+
+        with self.assertRaises(ValueError):
+            template.raw(title__salary__gt=None)
+
+        template = QueryTemplate(models.Employee.branches.all(),
+                                 ['title__isnull'])
+
+        with self.assertRaises(ValueError):
+            template.raw(title__isnull=True)
+
+        template = models.Employee.branches.template('title__salary__in')
+        self.assertEqual(len(list(template.raw(title__salary__in=[10, 20]))),
+                         2)
+
+        with self.assertRaises(ValueError):
+            template.raw(title__salary__in=[10])
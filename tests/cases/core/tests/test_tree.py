@@ -1,9 +1,21 @@
+import collections
+import gc
+import threading
+import time
+from unittest import skipIf
+
+from django.apps import apps
 from django.conf import settings
-from django.test import TestCase
-from modeltree.tree import trees, LazyModelTrees
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+from modeltree import tree as tree_module
+from modeltree.costs import StaticStatistics
+from modeltree.tree import trees, LazyModelTrees, ModelTree, ModelTreeNode
 from tests import models
 
-__all__ = ('LazyTreesTestCase', 'ModelTreeTestCase')
+__all__ = ('LazyTreesTestCase', 'BoundedTreesTestCase', 'WarmTestCase',
+           'ModelTreeNodeTestCase', 'ModelTreeTestCase')
 
 
 class LazyTreesTestCase(TestCase):
@@ -23,6 +35,225 @@ class LazyTreesTestCase(TestCase):
         self.assertEqual(len(trees), 1)
         self.assertEqual(trees._model_aliases[models.Employee], 'default')
 
+    def test_threads(self):
+        trees = LazyModelTrees({
+            'default': {'model': 'tests.Employee'},
+            'project': {'model': 'tests.Project'},
+            'office': {'model': 'tests.Office'},
+            'meeting': {'model': 'tests.Meeting'},
+        })
+
+        builds = collections.Counter()
+        build = ModelTree._build
+
+        def slow_build(tree):
+            builds[tree.alias] += 1
+            # Widens the window in which other threads request the tree
+            time.sleep(0.05)
+            build(tree)
+
+        start = threading.Event()
+        results = collections.defaultdict(set)
+
+        def work(n):
+            start.wait()
+
+            for i in range(20):
+                alias = sorted(trees.modeltrees)[(n + i) % 4]
+                results[alias].add(id(trees[alias]))
+
+        threads = [threading.Thread(target=work, args=(n,))
+                   for n in range(16)]
+
+        ModelTree._build = slow_build
+
+        try:
+            for t in threads:
+                t.start()
+
+            start.set()
+
+            for t in threads:
+                t.join()
+        finally:
+            ModelTree._build = build
+
+        self.assertEqual(dict(builds), dict.fromkeys(trees.modeltrees, 1))
+        self.assertEqual(dict((alias, len(ids))
+                              for alias, ids in results.items()),
+                         dict.fromkeys(trees.modeltrees, 1))
+        self.assertEqual(trees._model_aliases[models.Office], 'office')
+
+
+class BoundedTreesTestCase(TestCase):
+    def setUp(self):
+        self.trees = LazyModelTrees(getattr(settings, 'MODELTREES', {}),
+                                    max_trees=2)
+
+    def test_eviction(self):
+        trees = self.trees
+        default = trees.default
+
+        office = trees[models.Office]
+        title = trees['tests.title']
+        self.assertIs(trees[models.Office], office)
+
+        # The title tree is the least recently used
+        meeting = trees[models.Meeting]
+
+        self.assertEqual(len(trees), 3)
+        self.assertNotIn('tests.title', trees._modeltrees)
+        self.assertNotIn(models.Title, trees._model_aliases)
+        self.assertIs(trees[models.Office], office)
+        self.assertIs(trees[models.Meeting], meeting)
+
+        # Trees from settings are pinned
+        self.assertIs(trees.default, default)
+        self.assertIs(trees[models.Employee], default)
+
+        self.assertIsNot(trees[models.Title], title)
+
+        self.assertEqual(trees.stats(), {
+            'hits': 3,
+            'misses': 4,
+            'evictions': 2,
+            'size': 2,
+            'maxsize': 2,
+        })
+
+    def test_create(self):
+        trees = self.trees
+
+        trees.create(models.Office)
+        trees.create(models.Title)
+        trees.create('project', models.Meeting)
+
+        self.assertEqual(sorted(trees._modeltrees),
+                         ['project', 'tests.office', 'tests.title'])
+
+        trees.create(models.Meeting)
+
+        self.assertEqual(sorted(trees._modeltrees),
+                         ['project', 'tests.meeting', 'tests.title'])
+        self.assertEqual(trees.stats()['misses'], 0)
+
+    def test_unbounded(self):
+        trees = LazyModelTrees({})
+
+        for model in (models.Office, models.Title, models.Meeting):
+            trees[model]
+
+        self.assertEqual(len(trees), 3)
+        self.assertEqual(trees.stats()['evictions'], 0)
+
+        # Built trees are read without locking
+        trees._lock.acquire()
+
+        try:
+            self.assertIs(trees[models.Office], trees['tests.office'])
+        finally:
+            trees._lock.release()
+
+        self.assertEqual(trees.stats()['hits'], 2)
+        self.assertEqual(trees.stats()['size'], 3)
+
+
+class WarmTestCase(TestCase):
+    def setUp(self):
+        self.trees = LazyModelTrees(getattr(settings, 'MODELTREES', {}))
+
+    def test_warm(self):
+        built = self.trees.warm()
+
+        self.assertEqual(sorted(built), ['default', 'project'])
+        self.assertEqual(len(self.trees), 2)
+        self.assertEqual(built['default']['nodes'],
+                         len(self.trees['default']._nodes))
+
+        # Built trees are not built again
+        self.assertEqual(self.trees.warm(['default'])['default']['nodes'],
+                         built['default']['nodes'])
+
+    @skipIf(tree_module.ThreadPoolExecutor is None,
+            'The futures package is not installed')
+    def test_workers(self):
+        built = self.trees.warm(workers=2)
+
+        self.assertEqual(sorted(built), ['default', 'project'])
+        self.assertEqual(self.trees._model_aliases[models.Project],
+                         'project')
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command('modeltree', 'warm', 'project', stdout=stdout)
+
+        self.assertRegexpMatches(stdout.getvalue(),
+                                 r'^project: \d+ nodes in [\d.]+s$')
+
+    def test_ready(self):
+        config = apps.get_app_config('modeltree')
+        calls = []
+
+        trees.warm = lambda **kwargs: calls.append(kwargs)
+
+        try:
+            config.ready()
+            self.assertEqual(calls, [])
+
+            with override_settings(MODELTREE_WARM=True,
+                                   MODELTREE_WARM_WORKERS=2):
+                config.ready()
+
+            self.assertEqual(calls, [{'workers': 2}])
+        finally:
+            del trees.warm
+
+
+class ModelTreeNodeTestCase(TestCase):
+    def test_node(self):
+        tree = ModelTree(models.Employee)
+        node = tree._nodes[models.Title]
+
+        self.assertFalse(hasattr(node, '__dict__'))
+        self.assertIs(node.parent, tree.root_node)
+        self.assertIs(tree._nodes[models.Employee], tree.root_node)
+        self.assertEqual(node.parent_model, models.Employee)
+        self.assertEqual(node.model_name, 'Title')
+        self.assertEqual(node.db_table, 'tests_title')
+        self.assertEqual(tree.root_node.parent, None)
+
+        # Names are shared by the nodes of all trees
+        other = ModelTree(models.Office)._nodes[models.Title]
+        self.assertIs(node.relation, other.relation)
+        self.assertIs(node.related_name, other.related_name)
+
+    def test_freed(self):
+        def nodes():
+            gc.collect()
+            return sum(isinstance(obj, ModelTreeNode)
+                       for obj in gc.get_objects())
+
+        count = nodes()
+
+        # Trees with statistics do not share their nodes
+        tree = ModelTree(models.Employee, statistics=StaticStatistics())
+        self.assertEqual(nodes(), count + len(tree._nodes))
+
+        del tree
+        self.assertEqual(nodes(), count)
+
+    def test_detached(self):
+        tree = ModelTree(models.Office, statistics=StaticStatistics())
+        node = tree._node_path(models.Title)[-1]
+
+        # Nodes are usable after their tree is freed
+        del tree
+        gc.collect()
+
+        table, joins = node.get_joins()
+        self.assertEqual(table.table_name, 'tests_employee')
+        self.assertEqual(joins[0].table_name, 'tests_title')
+
 
 class ModelTreeTestCase(TestCase):
     def setUp(self):
@@ -109,6 +340,26 @@ class ModelTreeTestCase(TestCase):
         qstr = self.meeting_mt.query_string_for_field(start_time)
         self.assertEqual(qstr, 'start_time')
 
+    def test_join_templates(self):
+        node = self.office_mt._node_path(models.Project)[-1]
+
+        # Compiled when the tree is built
+        self.assertEqual(len(node._joins), 2)
+
+        table, joins = node.get_joins()
+        _, other = node.get_joins()
+
+        self.assertEqual(table.table_name, 'tests_employee')
+        self.assertEqual([j.table_name for j in joins],
+                         ['tests_project_employees', 'tests_project'])
+
+        # Each call returns new objects since queries modify them
+        self.assertEqual(joins, other)
+        self.assertIsNot(joins[0], other[0])
+
+        qs, alias = self.office_mt.add_joins(models.Project)
+        self.assertIsNone(node.get_joins()[1][1].table_alias)
+
     def test_get_join_types(self):
         """
         Django 1.6 decided it likes to put extra whitespace around parens
@@ -1,9 +1,13 @@
+from django.db.models.constants import LOOKUP_SEP
 from django.test import TestCase
-from modeltree.utils import resolve_lookup, M, InvalidLookup
+from modeltree.tree import ModelTree, trees
+from modeltree.utils import resolve_lookup, M, InvalidLookup, \
+    compile_lookups, _lookup_candidates, _resolve_lookup
 from tests.models import Office, Title, Employee, Project, Meeting
 
 
-__all__ = ('LookupResolverTestCase', 'MTestCase')
+__all__ = ('LookupResolverTestCase', 'CompiledLookupResolverTestCase',
+           'CompiledLookupsTestCase', 'MTestCase')
 
 
 class LookupResolverTestCase(TestCase):
@@ -200,6 +204,63 @@ class LookupResolverTestCase(TestCase):
             self.assertEqual(resolve_lookup(lookup, tree=tree), path)
 
 
+class CompiledLookupResolverTestCase(LookupResolverTestCase):
+    "Runs the resolver tests against compiled lookups."
+    models = (Office, Title, Employee, Project, Meeting)
+
+    def setUp(self):
+        for model in self.models:
+            compile_lookups(model)
+
+    def tearDown(self):
+        for model in self.models:
+            trees[model]._lookups = None
+
+
+class CompiledLookupsTestCase(TestCase):
+    def test_list(self):
+        lookups = compile_lookups(Office)
+
+        self.assertEqual(lookups['title__salary'], 'employee__title__salary')
+        self.assertEqual(lookups['tests__title'], 'employee__title')
+        self.assertEqual(lookups['location'], 'location')
+        self.assertNotIn('office__location', lookups)
+
+        trees[Office]._lookups = None
+
+    def test_precompile(self):
+        tree = ModelTree(Office, precompile_lookups=True)
+        self.assertEqual(resolve_lookup('title__salary', tree),
+                         'employee__title__salary')
+        self.assertIsNotNone(tree._lookups)
+
+    def test_equivalence(self):
+        operators = ((), ('exact',), ('in',), ('isnull',))
+
+        for model in (Office, Title, Employee, Project, Meeting):
+            mtree = trees[model]
+            compile_lookups(model)
+
+            for toks in _lookup_candidates(mtree):
+                for operator in operators:
+                    path = LOOKUP_SEP.join(toks + operator)
+
+                    try:
+                        expected = _resolve_lookup(list(toks + operator),
+                                                   mtree) or path
+                    except Exception as e:
+                        expected = e.__class__
+
+                    try:
+                        actual = resolve_lookup(path, model)
+                    except Exception as e:
+                        actual = e.__class__
+
+                    self.assertEqual(actual, expected, path)
+
+            mtree._lookups = None
+
+
 class MTestCase(TestCase):
     def test_variations(self):
         tests = [